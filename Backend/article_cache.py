@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Параметры отслеживания, которые не влияют на содержимое страницы
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'utm_referrer', '_openstat'}
+
+
+def normalize_url(url):
+    """Приводит URL к каноническому виду для ключа кэша"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.startswith('utm_') and k not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, netloc, parts.path or '/', urlencode(query), ''))
+
+
+def content_hash(content):
+    """Хэш тела страницы: одинаковый HTML не разбирается повторно"""
+    return hashlib.sha256(content).hexdigest()
+
+
+class ArticleCache:
+    """LRU кэш извлечённого текста статей с TTL и ревалидацией по ETag/Last-Modified.
+
+    Записи индексируются по нормализованному URL, извлечённый текст — ещё и
+    по хэшу HTML. Устаревшая запись не удаляется сразу: её валидаторы
+    используются для условного GET, и при 304 текст отдаётся без разбора.
+    Если задан cache_dir, записи дублируются на диск и переживают перезапуск.
+    """
+
+    def __init__(self, ttl=600, max_entries=256, cache_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._by_content = {}  # хэш HTML -> ключ записи
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'content_hits': 0,
+            'evictions': 0,
+            'disk_hits': 0
+        }
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry if entry.get('url') == key else None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Не удалось прочитать кэш статьи {path}: {e}")
+            return None
+
+    def _write_disk(self, key, entry):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Не удалось записать кэш статьи {path}: {e}")
+
+    def _store(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old and self._by_content.get(old['content_hash']) == key:
+            del self._by_content[old['content_hash']]
+        self._entries[key] = entry
+        self._by_content[entry['content_hash']] = key
+        while len(self._entries) > self.max_entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            if self._by_content.get(evicted['content_hash']) == evicted_key:
+                del self._by_content[evicted['content_hash']]
+            self._stats['evictions'] += 1
+
+    def lookup(self, key):
+        """Возвращает (запись, свежая ли она) или (None, False)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.cache_dir:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                    self._store(key, entry)
+        if entry is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None, False
+        fresh = time.time() - entry['validated_at'] < self.ttl
+        with self._lock:
+            self._stats['hits' if fresh else 'misses'] += 1
+        return dict(entry), fresh
+
+    def text_for_content(self, digest):
+        """Текст, уже извлечённый из HTML с таким же хэшем"""
+        with self._lock:
+            key = self._by_content.get(digest)
+            if key is None:
+                return None
+            self._stats['content_hits'] += 1
+            return self._entries[key]['text']
+
+    def revalidated(self, key):
+        """Сервер ответил 304: продлеваем запись"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['validated_at'] = time.time()
+            self._stats['revalidated'] += 1
+            entry = dict(entry)
+        if self.cache_dir:
+            self._write_disk(key, entry)
+
+    def put(self, key, digest, text, etag=None, last_modified=None):
+        entry = {
+            'url': key,
+            'content_hash': digest,
+            'text': text,
+            'etag': etag,
+            'last_modified': last_modified,
+            'validated_at': time.time()
+        }
+        with self._lock:
+            self._store(key, entry)
+        if self.cache_dir:
+            self._write_disk(key, entry)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'size': len(self._entries),
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0
+            }
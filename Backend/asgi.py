@@ -0,0 +1,407 @@
+"""ASGI режим сервера (SERVER_MODE=asgi или python asgi.py).
+
+Рерайт, рассылка и авторизация выполняются корутинами на aiohttp и
+AsyncOpenAI: ожидание ответа LLM не занимает поток, и один процесс держит
+сотни одновременных рерайтов. Остальные маршруты (потоковый рерайт,
+статистика, каналы, статус рассылки) обслуживает тот же Flask приложение
+через WSGI мост в пуле потоков.
+"""
+import asyncio
+import json
+import logging
+import os
+from urllib.parse import parse_qs
+
+import aiohttp
+import uvicorn
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+import server
+from article_cache import normalize_url
+from chunking import rewrite_chunks_async
+from http_clients import async_request, create_async_session
+from providers import ProviderUnavailable
+from response_cleaner import clean_model_response
+from token_store import AsyncTokenWaiter
+
+try:
+    from openai import AsyncOpenAI
+except ImportError:
+    AsyncOpenAI = None
+
+logger = logging.getLogger(__name__)
+
+ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', 20))  # Потоки для маршрутов Flask
+ASGI_HTTP_LIMIT = int(os.getenv('ASGI_HTTP_LIMIT', 200))  # Соединений в пуле aiohttp
+
+flask_app = WSGIMiddleware(server.app, workers=ASGI_WSGI_WORKERS)
+token_waiter = AsyncTokenWaiter(server.token_store)
+
+# Создаются при старте приложения (lifespan), внутри event loop uvicorn
+article_http = None
+openrouter_http = None
+yandex_client = None
+
+
+async def startup():
+    global article_http, openrouter_http, yandex_client
+    article_http = create_async_session(
+        limit=ASGI_HTTP_LIMIT,
+        limit_per_host=int(os.getenv('ARTICLE_HTTP_POOL_SIZE', 4)),
+        timeout=15,
+        headers=server.ARTICLE_REQUEST_HEADERS
+    )
+    openrouter_http = create_async_session(
+        limit=ASGI_HTTP_LIMIT,
+        limit_per_host=ASGI_HTTP_LIMIT,
+        timeout=60
+    )
+    if server.yandex_client and AsyncOpenAI:
+        yandex_client = AsyncOpenAI(
+            api_key=server.YANDEX_CLOUD_API_KEY,
+            base_url="https://rest-assistant.api.cloud.yandex.net/v1",
+            project=server.YANDEX_CLOUD_PROJECT
+        )
+    server.rewrite_providers['qwen'].async_rewrite = rewrite_article_with_openrouter
+    server.rewrite_providers['yandex'].async_rewrite = rewrite_article_with_yandex
+    logger.info("ASGI режим: асинхронные клиенты инициализированы")
+
+
+async def shutdown():
+    await article_http.close()
+    await openrouter_http.close()
+    if yandex_client:
+        await yandex_client.close()
+
+
+async def fetch_article_page(url, etag=None, last_modified=None):
+    """Асинхронный вариант server.fetch_article_page"""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    response = await async_request(
+        article_http, 'GET', url,
+        retries=server.HTTP_RETRIES,
+        backoff_factor=server.HTTP_RETRY_BACKOFF,
+        headers=headers
+    )
+    async with response:
+        if response.status == 304:
+            return None
+        response.raise_for_status()
+        server.check_article_content_type(response.headers.get('Content-Type', ''))
+
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(65536):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > server.ARTICLE_MAX_BYTES:
+                break
+        return server.make_article_page(url, chunks, response.headers)
+
+
+async def extract_article_text(url):
+    """Асинхронный вариант server.extract_article_text: загрузка без потока, разбор HTML в пуле потоков"""
+    cache_key = normalize_url(url)
+    entry, fresh = server.article_cache.lookup(cache_key)
+    if entry and fresh:
+        logger.info(f"Текст статьи взят из кэша: {url}")
+        return entry['text']
+
+    try:
+        page = await fetch_article_page(
+            url,
+            etag=entry['etag'] if entry else None,
+            last_modified=entry['last_modified'] if entry else None
+        )
+        if page is None:
+            logger.info(f"Страница не изменилась (304), используем кэш: {url}")
+            server.article_cache.revalidated(cache_key)
+            return entry['text']
+
+        return await asyncio.to_thread(server.extract_page_text, url, cache_key, page)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Ошибка HTTP запроса к {url}: {e}")
+        raise ValueError(f"Не удалось загрузить страницу: {str(e) or type(e).__name__}")
+
+
+async def rewrite_article_with_openrouter(article_text, style):
+    """Асинхронный вариант server.rewrite_article_with_openrouter"""
+    headers, payload = server.build_openrouter_request(article_text, style)
+    logger.info(f"Отправка запроса в OpenRouter для стиля: {style}")
+    try:
+        response = await async_request(
+            openrouter_http, 'POST', server.OPENROUTER_API_URL,
+            retries=server.HTTP_RETRIES,
+            backoff_factor=server.HTTP_RETRY_BACKOFF,
+            headers=headers,
+            json=payload
+        )
+        async with response:
+            if response.status >= 400:
+                logger.error(f"Ответ сервера: {await response.text()}")
+            response.raise_for_status()
+            result = await response.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Ошибка HTTP запроса к OpenRouter: {e}")
+        raise ValueError(f"Ошибка подключения к OpenRouter API: {str(e) or type(e).__name__}")
+
+    if 'choices' in result and len(result['choices']) > 0:
+        return clean_model_response(result['choices'][0]['message']['content'])
+    logger.error(f"Неожиданный формат ответа: {result}")
+    raise ValueError("Неожиданный формат ответа от OpenRouter API")
+
+
+async def rewrite_article_with_yandex(article_text, style):
+    """Асинхронный вариант server.rewrite_article_with_yandex"""
+    if not yandex_client:
+        raise ValueError("YandexGPT API не настроен. Добавьте YANDEX_CLOUD_API_KEY в .env")
+    try:
+        response = await yandex_client.responses.create(
+            prompt={
+                "id": server.YANDEX_CLOUD_ASSISTANT_ID,
+            },
+            input=server.build_yandex_prompt(article_text, style),
+        )
+    except Exception as e:
+        logger.error(f"Ошибка рерайта через YandexGPT: {e}")
+        raise ValueError(f"Ошибка подключения к YandexGPT API: {str(e)}")
+    return clean_model_response(response.output_text)
+
+
+async def rewrite_article_text(article_text, style, provider, chunked=False):
+    """Асинхронный вариант server.rewrite_article_text"""
+    rewrite = server.rewrite_providers[provider].arewrite
+    if not chunked:
+        return await rewrite(article_text, style)
+    return await rewrite_chunks_async(
+        server.split_article(article_text),
+        lambda chunk: rewrite(chunk, style),
+        server.REWRITE_CHUNK_WORKERS
+    )
+
+
+async def rewrite_article(data):
+    """POST /api/rewrite-article"""
+    error = server.check_rewrite_request(data)
+    if error:
+        return 400, {'success': False, 'error': error}
+
+    article_url = data['url']
+    logger.info(f"Извлечение текста из URL: {article_url}")
+    try:
+        article_text = await extract_article_text(article_url)
+        logger.info(f"Текст извлечён, длина: {len(article_text)} символов")
+    except Exception as e:
+        logger.error(f"Ошибка извлечения текста из {article_url}: {e}")
+        return 400, {'success': False, 'error': f'Не удалось извлечь текст статьи: {str(e)}'}
+
+    params, error = server.build_rewrite_params(data, article_text)
+    if error:
+        return 400, {'success': False, 'error': error}
+    style = params['style']
+    provider = params['provider']
+
+    if not params['fresh']:
+        cached_text = server.rewrite_cache.get(params['cache_key'])
+        if cached_text is not None:
+            logger.info(f"Результат рерайта взят из кэша ({provider}, {style})")
+            return 200, {'success': True, 'text': cached_text, 'provider': provider, 'cached': True}
+
+    logger.info(f"Рерайт статьи через {provider} в стиле: {style}, длина текста: {len(article_text)}")
+    try:
+        rewritten_text = await rewrite_article_text(article_text, style, provider, params['chunked'])
+        logger.info(f"Рерайт завершён, длина результата: {len(rewritten_text)} символов")
+    except ProviderUnavailable as e:
+        logger.error(f"Провайдер {provider} недоступен: {e}")
+        return 503, {'success': False, 'error': str(e)}
+    except Exception as e:
+        logger.error(f"Ошибка рерайта через {provider}: {e}")
+        return 500, {'success': False, 'error': f'Ошибка рерайта: {str(e)}'}
+
+    server.rewrite_cache.put(params['cache_key'], rewritten_text)
+    return 200, {'success': True, 'text': rewritten_text, 'provider': provider, 'cached': False}
+
+
+async def send_article(data):
+    """POST /api/send-article: рассылка ожидается без блокировки потока"""
+    article_text = data.get('article_text', '')
+    channels_to_send, error = server.select_channels(data)
+    if error:
+        return 400, {'success': False, 'error': error}
+
+    if data.get('async'):
+        return 202, server.start_broadcast_job(channels_to_send, article_text)
+
+    success_count, failed_channels = await asyncio.wrap_future(
+        server.bot_runtime.submit(server.broadcast_article(channels_to_send, article_text))
+    )
+    return 200, {
+        'success': True,
+        'sent': success_count,
+        'total': len(channels_to_send),
+        'failed': failed_channels
+    }
+
+
+async def generate_token(data):
+    """POST /api/auth/generate-token"""
+    token = server.generate_auth_token()
+    return 200, {'success': True, 'token': token, 'expires_in': server.AUTH_TOKEN_TTL}
+
+
+async def verify_token(data):
+    """POST /api/auth/verify-token"""
+    token = data.get('token')
+    if not token:
+        return 400, {'success': False, 'error': 'Токен не предоставлен'}
+
+    user_data = server.verify_auth_token(token)
+    if user_data:
+        return 200, {'success': True, 'authorized': True, 'user': user_data}
+    return 200, {'success': True, 'authorized': False, 'message': 'Токен не найден или не авторизован'}
+
+
+async def authorize(data):
+    """POST /api/auth/authorize (вызывается ботом)"""
+    token = data.get('token')
+    user_data = data.get('user_data')
+    if not token or not user_data:
+        return 400, {'success': False, 'error': 'Недостаточно данных'}
+
+    if server.authorize_token(token, user_data):
+        logger.info(f"Токен {token[:10]}... успешно авторизован для пользователя {user_data.get('id')}")
+        return 200, {'success': True}
+    return 404, {'success': False, 'error': 'Токен не найден или истек'}
+
+
+ROUTES = {
+    '/api/rewrite-article': rewrite_article,
+    '/api/send-article': send_article,
+    '/api/auth/generate-token': generate_token,
+    '/api/auth/verify-token': verify_token,
+    '/api/auth/authorize': authorize,
+}
+
+WAIT_PREFIX = '/api/auth/wait/'
+
+
+async def read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return json.loads(body) if body else None
+
+
+async def send_response(send, status, body, content_type='application/json', more_body=False):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode()),
+            (b'access-control-allow-origin', b'*'),
+            (b'cache-control', b'no-cache'),
+        ] + ([] if more_body else [(b'content-length', str(len(body)).encode())])
+    })
+    await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+
+async def send_json(send, status, payload):
+    await send_response(send, status, json.dumps(payload).encode())
+
+
+async def handle_json(handler, receive, send):
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        if handler is not generate_token:
+            await send_json(send, 400, {'success': False, 'error': 'Отсутствует тело запроса'})
+            return
+        data = {}
+    try:
+        status, payload = await handler(data)
+    except Exception as e:
+        logger.error(f"Ошибка обработки запроса {handler.__name__}: {e}", exc_info=True)
+        status, payload = 500, {'success': False, 'error': f'Внутренняя ошибка сервера: {str(e)}'}
+    await send_json(send, status, payload)
+
+
+async def wait_token(scope, send, token):
+    """GET /api/auth/wait/<token>: SSE поток или long-poll, как в server.wait_token"""
+    headers = dict(scope['headers'])
+    if b'text/event-stream' in headers.get(b'accept', b''):
+        await send_response(send, 200, b'', content_type='text/event-stream', more_body=True)
+        while True:
+            token_data = await token_waiter.wait(token, server.AUTH_WAIT_HEARTBEAT)
+            if token_data is None:
+                await send({'type': 'http.response.body', 'body': b"event: expired\ndata: {}\n\n"})
+                return
+            if token_data['status'] == 'authorized':
+                payload = json.dumps({'user': token_data.get('user_data')}, ensure_ascii=False)
+                await send({'type': 'http.response.body', 'body': f"event: authorized\ndata: {payload}\n\n".encode()})
+                return
+            await send({'type': 'http.response.body', 'body': b": ping\n\n", 'more_body': True})
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    try:
+        timeout = min(float(query.get('timeout', [server.AUTH_WAIT_TIMEOUT])[0]), server.AUTH_WAIT_TIMEOUT)
+    except ValueError:
+        await send_json(send, 400, {'success': False, 'error': 'Неверный timeout'})
+        return
+
+    token_data = await token_waiter.wait(token, max(timeout, 0))
+    if token_data and token_data['status'] == 'authorized':
+        await send_json(send, 200, {'success': True, 'authorized': True, 'user': token_data.get('user_data')})
+        return
+    await send_json(send, 200, {
+        'success': True,
+        'authorized': False,
+        'expired': token_data is None,
+        'message': 'Токен не найден или не авторизован'
+    })
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI приложение: основные маршруты — корутины, остальное — Flask"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'http':
+        path, method = scope['path'], scope['method']
+        if method == 'POST' and path in ROUTES:
+            await handle_json(ROUTES[path], receive, send)
+            return
+        if method == 'GET' and path.startswith(WAIT_PREFIX) and len(path) > len(WAIT_PREFIX):
+            await wait_token(scope, send, path[len(WAIT_PREFIX):])
+            return
+    await flask_app(scope, receive, send)
+
+
+def run(port):
+    """Запускает uvicorn (один процесс, один event loop)"""
+    logger.info(f"Запуск в режиме ASGI на порту {port}")
+    uvicorn.run(app, host='0.0.0.0', port=port, log_level='info')
+
+
+if __name__ == '__main__':
+    run(int(os.getenv('PORT', 5000)))
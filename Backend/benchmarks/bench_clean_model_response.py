@@ -0,0 +1,146 @@
+"""Золотой корпус и микробенчмарк для clean_model_response.
+
+Сравнивает текущую предкомпилированную реализацию с прежней (последовательные
+re.sub) на корпусе типичных ответов моделей и замеряет время.
+
+Запуск из папки Backend:
+    python benchmarks/bench_clean_model_response.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cleaner import PREFIXES_TO_REMOVE, clean_model_response  # noqa: E402
+
+
+def legacy_clean_model_response(text):
+    """Прежняя реализация clean_model_response (эталон для сравнения)"""
+    if not text:
+        return ""
+    
+    original_text = text
+    text = text.strip()
+    
+    # Удаляем теги reasoning (включая содержимое между ними)
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<reasoning>.*?</reasoning>', '', text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<thinking>.*?</thinking>', '', text, flags=re.DOTALL | re.IGNORECASE)
+    # Удаляем оставшиеся одиночные теги
+    text = re.sub(r'</?redacted_reasoning>', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'</?reasoning>', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'</?thinking>', '', text, flags=re.IGNORECASE)
+    
+    # Удаляем распространённые предисловия (регистронезависимо)
+    for prefix in PREFIXES_TO_REMOVE:
+        text = re.sub(prefix, '', text, flags=re.IGNORECASE).strip()
+    
+    # Удаляем мысли в скобках
+    text = re.sub(r'\([^)]*(?:думаю|я думаю|можно|вариант|переписанный|think|thinking)[^)]*\)', '', text, flags=re.IGNORECASE)
+    
+    # Удаляем кавычки в начале и конце, если они есть
+    text = re.sub(r'^["\'«»]|["\'«»]$', '', text).strip()
+    
+    # Удаляем строки, которые выглядят как мысли
+    lines = text.split('\n')
+    cleaned_lines = []
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        
+        # Пропускаем строки, которые явно являются мыслями
+        thought_patterns = [
+            r'^(думаю|я думаю|можно|вариант|переписанный|вот|это|так|например|то есть|think|thinking)',
+            r'^\(.*(думаю|можно|вариант).*\)$'
+        ]
+        
+        is_thought = False
+        for pattern in thought_patterns:
+            if re.match(pattern, line, re.IGNORECASE) and len(line) < 150:
+                is_thought = True
+                break
+        
+        if not is_thought:
+            cleaned_lines.append(line)
+    
+    result = '\n'.join(cleaned_lines).strip()
+    
+    # Если после очистки осталось слишком мало текста, возвращаем оригинал
+    if len(result) < 20:
+        return original_text.strip()
+    
+    return result
+
+
+LONG_BODY = "\n".join(
+    f"Абзац {i}: учёные из разных стран продолжают исследовать явление, "
+    f"которое долгое время оставалось без объяснения, и приводят новые данные."
+    for i in range(120)
+)
+
+# Типичные ответы моделей: мысли в тегах, предисловия, кавычки, строки-мысли
+GOLDEN_CORPUS = [
+    "",
+    "   ",
+    "Коротко.",
+    "Учёные обнаружили новую экзопланету в зоне обитаемости звезды.",
+    "<think>Нужно переписать в мемном стиле</think>Короче, учёные нашли планету, где можно жить 🚀",
+    "<THINK>верхний регистр</THINK>\nТекст после размышлений достаточно длинный.",
+    "<reasoning>рассуждение</reasoning>Результат: рынок вырос на 5% за квартал.",
+    "<thinking>\nмного\nстрок\n</thinking>\n\nИтоговый текст статьи про экономику и рынки.",
+    "</redacted_reasoning>Текст после одиночного закрывающего тега статьи.",
+    "<redacted_reasoning>Текст внутри одиночных тегов статьи</redacted_reasoning>",
+    "</thinking>Хвост размышлений и затем нормальный текст статьи.",
+    "Вот переписанный текст: Компания представила новый смартфон с улучшенной камерой.",
+    "Вот переписанный текст:\nКомпания представила новый смартфон с улучшенной камерой.",
+    "ПЕРЕПИСАННЫЙ ВАРИАНТ: Компания представила новый смартфон с улучшенной камерой.",
+    "Вот: переписанный текст: Компания представила новый смартфон с камерой.",
+    "Думаю, вот вариант: компания представила новый смартфон с камерой.",
+    "Я думаю, текст в стиле: компания представила новый смартфон.",
+    "Think: thinking: Вот: компания представила новый смартфон с камерой.",
+    "Вот как можно переписать: «Компания представила новый смартфон с камерой»",
+    "\"Компания представила новый смартфон с улучшенной камерой.\"",
+    "«Компания представила новый смартфон с улучшенной камерой.»",
+    "Компания (я думаю, это важно) представила новый смартфон с камерой.",
+    "Компания представила (вариант: показала) новый смартфон с улучшенной камерой.",
+    "Первая строка статьи достаточно длинная.\nВот ещё одна мысль модели\nТак вот, итог.\nПоследняя строка статьи тоже длинная.",
+    "Например, это короткая строка-мысль\nНормальный текст статьи, который должен остаться в ответе.",
+    "(можно сделать иначе)\nНормальный текст статьи, который должен остаться в ответе.",
+    "Это " + "очень " * 40 + "длинная строка, которая начинается с «Это», но длиннее 150 символов.",
+    "Вот",
+    "<think>только мысли без ответа</think>",
+    "Текст со скобками (без ключевых слов) и цифрами (2024) остаётся как есть в ответе.",
+    "<think>мысль</think>\nВот переписанный текст:\n\n" + LONG_BODY,
+    LONG_BODY,
+]
+
+
+def check_golden():
+    mismatches = 0
+    for sample in GOLDEN_CORPUS:
+        expected = legacy_clean_model_response(sample)
+        actual = clean_model_response(sample)
+        if expected != actual:
+            mismatches += 1
+            print(f"РАСХОЖДЕНИЕ:\n  вход: {sample[:80]!r}\n  было: {expected[:80]!r}\n  стало: {actual[:80]!r}")
+    print(f"Золотой корпус: {len(GOLDEN_CORPUS) - mismatches}/{len(GOLDEN_CORPUS)} совпадений")
+    return mismatches == 0
+
+
+def bench(number=200):
+    samples = GOLDEN_CORPUS
+    legacy = timeit.timeit(lambda: [legacy_clean_model_response(s) for s in samples], number=number)
+    current = timeit.timeit(lambda: [clean_model_response(s) for s in samples], number=number)
+    print(f"Прежняя реализация:  {legacy * 1000 / number:.2f} мс на корпус")
+    print(f"Текущая реализация:  {current * 1000 / number:.2f} мс на корпус")
+    print(f"Ускорение: x{legacy / current:.1f}")
+
+
+if __name__ == '__main__':
+    ok = check_golden()
+    bench()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,100 @@
+"""Сравнение парсеров HTML для извлечения текста статьи.
+
+Замеряет прежний каскад soup.find на html.parser и extract_html_text на всех
+установленных парсерах (html.parser, lxml, selectolax), а также проверяет,
+что извлечённый текст совпадает с прежним.
+
+Страницы берутся из аргументов командной строки или из benchmarks/fixtures/*.html
+(сохраните туда реальные страницы, например с Dzen); если их нет, используется
+сгенерированная страница.
+
+Запуск из папки Backend:
+    python benchmarks/bench_html_backends.py [page.html ...]
+"""
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from html_extraction import available_backends, extract_html_text  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_extract(content):
+    """Прежний каскад: decompose и семь последовательных soup.find"""
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style", "nav", "header", "footer"]):
+        script.decompose()
+    article = (soup.find('article') or
+               soup.find('main') or
+               soup.find('div', class_='content') or
+               soup.find('div', class_='article') or
+               soup.find('div', {'data-testid': 'article-content'}) or
+               soup.find('div', class_='zen-article') or
+               soup.find('div', class_='article-body'))
+    if article:
+        return article.get_text(separator='\n', strip=True)
+    body = soup.find('body')
+    if body:
+        return body.get_text(separator='\n', strip=True)
+    return soup.get_text(separator='\n', strip=True)
+
+
+def clean_lines(text):
+    """Построчная очистка, как в parse_article_html"""
+    return [line.strip() for line in text.split('\n') if line.strip() and len(line.strip()) > 3]
+
+
+def synthetic_page(paragraphs=400, widgets=1500):
+    """Страница в духе Dzen: много обвязки вокруг статьи в глубоко вложенных div"""
+    noise = ''.join(
+        f'<div class="card"><div class="card__inner"><a href="/p/{i}">Рекомендация {i}</a>'
+        f'<span class="meta">{i} просмотров</span></div></div>'
+        for i in range(widgets)
+    )
+    body = ''.join(
+        f'<p>Абзац {i}: подробный текст статьи о событиях недели и их последствиях.</p>'
+        for i in range(paragraphs)
+    )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Статья</title>'
+        '<style>.card{color:red}</style><script>var x = 1;</script></head><body>'
+        f'<header><nav>Меню</nav></header><div class="feed">{noise}</div>'
+        f'<div data-testid="article-content"><h1>Заголовок</h1>{body}'
+        '<script>track()</script></div>'
+        f'<div class="sidebar">{noise}</div><footer>Подвал</footer></body></html>'
+    ).encode('utf-8')
+
+
+def load_pages(paths):
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read()))
+    if not pages:
+        pages.append(('synthetic', synthetic_page()))
+    return pages
+
+
+def main(paths, number=5):
+    for name, content in load_pages(paths):
+        print(f"{name}: {len(content) / 1024:.0f} КБ")
+        expected = clean_lines(legacy_extract(content))
+        legacy_time = timeit.timeit(lambda: legacy_extract(content), number=number) / number
+        print(f"  {'прежний каскад (html.parser)':32} {legacy_time * 1000:8.1f} мс")
+        for backend in available_backends():
+            elapsed = timeit.timeit(lambda: extract_html_text(content, backend, 'utf-8'), number=number) / number
+            same = clean_lines(extract_html_text(content, backend, 'utf-8')) == expected
+            print(f"  {backend:32} {elapsed * 1000:8.1f} мс  x{legacy_time / elapsed:4.1f}  "
+                  f"{'текст совпадает' if same else 'ТЕКСТ ОТЛИЧАЕТСЯ'}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
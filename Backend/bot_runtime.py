@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import threading
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+
+logger = logging.getLogger(__name__)
+
+
+class BotRuntime:
+    """Фоновый поток с постоянным event loop и одним экземпляром Bot.
+
+    Flask обработчики передают корутины в этот loop через run()/submit(),
+    поэтому соединения с api.telegram.org переиспользуются между запросами.
+    """
+
+    def __init__(self, token, connection_limit=100, keepalive_timeout=60):
+        self.token = token
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.bot = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def start(self):
+        """Создаёт Bot и запускает поток с event loop.
+
+        Bot создаётся в вызывающем потоке, поэтому ошибка (например, неверный
+        токен) пробрасывается отсюда, а не теряется в фоновом потоке.
+        """
+        if self._thread:
+            return
+        session = AiohttpSession()
+        # aiogram 3.3 не принимает настройки коннектора в конструкторе сессии
+        session._connector_init.update(
+            limit=self.connection_limit,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        self.bot = Bot(token=self.token, session=session)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='bot-runtime', daemon=True)
+        self._thread.start()
+        logger.info("Фоновый event loop для Bot запущен")
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self.bot.session.close())
+            self._loop.close()
+
+    def submit(self, coro):
+        """Планирует корутину в фоновом loop, возвращает concurrent.futures.Future"""
+        if not self._thread:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout=None):
+        """Выполняет корутину в фоновом loop и ждёт результат"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def shutdown(self, timeout=10):
+        """Закрывает сессию Bot и останавливает loop"""
+        if not self._thread or not self._loop.is_running():
+            return
+
+        async def cancel_pending():
+            current = asyncio.current_task()
+            pending = [t for t in asyncio.all_tasks() if t is not current]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_pending(), self._loop).result(timeout)
+        except Exception as e:
+            logger.error(f"Ошибка отмены задач Bot: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        logger.info("Фоновый event loop для Bot остановлен")
@@ -0,0 +1,92 @@
+import logging
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastJob:
+    """Задача рассылки статьи с прогрессом по каждому каналу"""
+
+    def __init__(self, job_id, channels):
+        self.id = job_id
+        self.status = 'queued'  # queued, running, done, error
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.channels = [
+            {'id': ch['id'], 'name': ch.get('name', ch['id']), 'status': 'pending', 'error': None}
+            for ch in channels
+        ]
+        self._by_id = {ch['id']: ch for ch in self.channels}
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.status = 'running'
+
+    def record(self, channel, failure):
+        """Отмечает результат отправки в канал (совместим с on_result у send_to_channels)"""
+        with self._lock:
+            entry = self._by_id[channel['id']]
+            entry['status'] = 'failed' if failure else 'sent'
+            entry['error'] = failure['error'] if failure else None
+
+    def finish(self, error=None):
+        with self._lock:
+            self.status = 'error' if error else 'done'
+            self.error = error
+            self.finished_at = time.time()
+
+    def to_dict(self):
+        """Состояние задачи в формате ответа /api/send-article плюс прогресс по каналам"""
+        with self._lock:
+            channels = [dict(ch) for ch in self.channels]
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'error': self.error,
+                'sent': sum(1 for ch in channels if ch['status'] == 'sent'),
+                'total': len(channels),
+                'failed': [
+                    {'channel': ch['name'], 'error': ch['error']}
+                    for ch in channels if ch['status'] == 'failed'
+                ],
+                'channels': channels,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at
+            }
+
+
+class BroadcastJobStore:
+    """Хранилище задач рассылки в памяти; завершённые задачи хранятся retention секунд"""
+
+    def __init__(self, retention=3600):
+        self.retention = retention
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, channels):
+        self.purge()
+        job = BroadcastJob(secrets.token_urlsafe(12), channels)
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def purge(self):
+        """Удаляет завершённые задачи старше retention"""
+        threshold = time.time() - self.retention
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < threshold
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if expired:
+            logger.info(f"Удалено завершённых задач рассылки: {len(expired)}")
@@ -0,0 +1,96 @@
+import asyncio
+import re
+
+# Грубая оценка без токенизатора: для русского текста у BPE моделей
+# в среднем около 3 символов на токен
+CHARS_PER_TOKEN = 3
+
+SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+
+# Разделитель переписанных кусков в итоговом тексте
+CHUNK_SEPARATOR = '\n\n'
+
+
+def estimate_tokens(text, chars_per_token=CHARS_PER_TOKEN):
+    """Оценка числа токенов по длине текста"""
+    return -(-len(text) // chars_per_token)
+
+
+def _pack(parts, max_chars, separator, target=None):
+    """Жадно склеивает части в куски не длиннее max_chars, закрывая кусок по достижении target"""
+    target = target or max_chars
+    chunks, current, size = [], [], 0
+    for part in parts:
+        extra = len(part) + (len(separator) if current else 0)
+        if current and size + extra > max_chars:
+            chunks.append(separator.join(current))
+            current, size, extra = [], 0, len(part)
+        current.append(part)
+        size += extra
+        if size >= target:
+            chunks.append(separator.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def _split_long(paragraph, max_chars):
+    """Абзац длиннее бюджета режется по предложениям, слишком длинное предложение — по пробелам"""
+    pieces = []
+    for sentence in SENTENCE_END_RE.split(paragraph):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+    return _pack(pieces, max_chars, ' ')
+
+
+def split_into_chunks(text, max_tokens, chars_per_token=CHARS_PER_TOKEN):
+    """Делит текст по границам абзацев на куски примерно одинакового размера, не больше max_tokens.
+
+    Число кусков минимально для бюджета, а их размер выравнивается, чтобы
+    параллельный рерайт не ждал один большой последний кусок.
+    """
+    max_chars = max(max_tokens * chars_per_token, 1)
+    paragraphs = []
+    for paragraph in text.split('\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars:
+            paragraphs.extend(_split_long(paragraph, max_chars))
+        else:
+            paragraphs.append(paragraph)
+
+    total = sum(len(paragraph) + 1 for paragraph in paragraphs)
+    count = -(-total // max_chars)
+    if count <= 1:
+        return ['\n'.join(paragraphs)] if paragraphs else []
+    return _pack(paragraphs, max_chars, '\n', target=-(-total // count))
+
+
+def rewrite_chunks(chunks, rewrite, executor):
+    """Рерайтит куски параллельно в executor и склеивает результаты в исходном порядке"""
+    futures = [executor.submit(rewrite, chunk) for chunk in chunks]
+    try:
+        return CHUNK_SEPARATOR.join(future.result() for future in futures)
+    finally:
+        # При ошибке одного куска остальные, ещё не начатые, не нужны
+        for future in futures:
+            future.cancel()
+
+
+async def rewrite_chunks_async(chunks, rewrite, concurrency):
+    """Асинхронный вариант: не больше concurrency кусков одновременно, порядок сохраняется"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def rewrite_one(chunk):
+        async with semaphore:
+            return await rewrite(chunk)
+
+    return CHUNK_SEPARATOR.join(await asyncio.gather(*(rewrite_one(chunk) for chunk in chunks)))
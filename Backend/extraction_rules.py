@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+import soupsieve
+
+from html_extraction import LXML_AVAILABLE
+
+if LXML_AVAILABLE:
+    import lxml.etree
+
+logger = logging.getLogger(__name__)
+
+
+def is_xpath(selector):
+    return selector.startswith(('/', './', '(', 'descendant::'))
+
+
+class ExtractionRule:
+    """Правило извлечения статьи для набора доменов.
+
+    content — селекторы основного контента в порядке приоритета, remove —
+    элементы, удаляемые до извлечения, next_page — ссылка на следующую
+    страницу статьи (не больше max_pages страниц). Селекторы одного правила
+    либо все CSS, либо все XPath (начинаются с '/' или './', нужен lxml).
+    Селекторы компилируются один раз под выбранный парсер.
+    """
+
+    def __init__(self, name, domains, content, remove=(), next_page=None, max_pages=1):
+        if not domains or not content:
+            raise ValueError(f"Правило {name}: нужны domains и content")
+        self.name = name
+        self.domains = [domain.lower() for domain in domains]
+        self.max_pages = max(1, int(max_pages))
+        selectors = list(content) + list(remove) + ([next_page] if next_page else [])
+        kinds = {is_xpath(selector) for selector in selectors}
+        if len(kinds) > 1:
+            raise ValueError(f"Правило {name}: CSS и XPath селекторы нельзя смешивать")
+        self.engine = 'xpath' if kinds == {True} else 'css'
+        if self.engine == 'xpath' and not LXML_AVAILABLE:
+            raise ValueError(f"Правило {name}: XPath селекторы требуют lxml")
+        self._source = (list(content), list(remove), next_page)
+        self.content = self.remove = self.next_page = None
+
+    def compile(self, backend):
+        """Компилирует селекторы: XPath — lxml, CSS — soupsieve (для selectolax — только проверка)"""
+        content, remove, next_page = self._source
+        if self.engine == 'xpath':
+            self.content = [lxml.etree.XPath(xpath) for xpath in content]
+            self.remove = lxml.etree.XPath(' | '.join(remove)) if remove else None
+            self.next_page = lxml.etree.XPath(next_page) if next_page else None
+            return self
+        compiled_content = [soupsieve.compile(css) for css in content]
+        compiled_remove = soupsieve.compile(', '.join(remove)) if remove else None
+        compiled_next = soupsieve.compile(next_page) if next_page else None
+        if backend == 'selectolax':
+            # selectolax компилирует CSS сам, храним строки
+            self.content = content
+            self.remove = ', '.join(remove) if remove else None
+            self.next_page = next_page
+        else:
+            self.content = compiled_content
+            self.remove = compiled_remove
+            self.next_page = compiled_next
+        return self
+
+
+class ExtractionRules:
+    """Реестр правил извлечения: поиск по хосту за O(1) и счётчики по правилам"""
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self._by_host = {}
+        for rule in self.rules:
+            for domain in rule.domains:
+                if domain in self._by_host:
+                    logger.warning(f"Домен {domain} уже занят правилом {self._by_host[domain].name}")
+                    continue
+                self._by_host[domain] = rule
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @classmethod
+    def load(cls, path, backend):
+        """Загружает и компилирует правила из JSON файла; ошибочные правила пропускаются"""
+        if not path or not os.path.exists(path):
+            logger.info(f"Файл правил извлечения не найден ({path}), используется общий каскад")
+            return cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Ошибка чтения правил извлечения {path}: {e}")
+            return cls()
+
+        rules = []
+        for item in config.get('rules', []):
+            name = item.get('name', '?')
+            try:
+                rule = ExtractionRule(
+                    name=name,
+                    domains=item.get('domains', []),
+                    content=item.get('content', []),
+                    remove=item.get('remove', []),
+                    next_page=item.get('next_page'),
+                    max_pages=item.get('max_pages', 1)
+                )
+                rules.append(rule.compile(backend))
+            except Exception as e:
+                logger.error(f"Правило извлечения {name} пропущено: {e}")
+        registry = cls(rules)
+        logger.info(f"Загружено правил извлечения: {len(rules)} (доменов: {len(registry._by_host)})")
+        return registry
+
+    def for_url(self, url):
+        """Правило для хоста URL: точное совпадение, затем родительские домены"""
+        host = (urlsplit(url).hostname or '').lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        while host:
+            rule = self._by_host.get(host)
+            if rule is not None:
+                return rule
+            host = host.partition('.')[2]
+        return None
+
+    def record(self, result):
+        """Учитывает, какое правило сработало и сколько текста извлечено и отброшено"""
+        extracted = len(result.text)
+        with self._lock:
+            stats = self._stats.setdefault(result.rule, {'pages': 0, 'chars_extracted': 0, 'chars_discarded': 0})
+            stats['pages'] += 1
+            stats['chars_extracted'] += extracted
+            stats['chars_discarded'] += max(result.total_chars - extracted, 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rules': len(self.rules),
+                'domains': len(self._by_host),
+                'by_rule': {name: dict(stats) for name, stats in self._stats.items()}
+            }
@@ -0,0 +1,292 @@
+import codecs
+import logging
+import re
+from collections import namedtuple
+
+from bs4 import BeautifulSoup, Tag
+from requests.compat import chardet
+
+logger = logging.getLogger(__name__)
+
+# Опциональные быстрые парсеры
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+try:
+    import lxml.etree
+    import lxml.html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# Теги, которые удаляются вместе с содержимым до извлечения текста
+REMOVED_TAGS = ('script', 'style', 'nav', 'header', 'footer')
+
+# Селекторы основного контента в порядке приоритета: (тег, атрибут, значение).
+# Для Dzen.ru и других платформ
+CONTENT_SELECTORS = (
+    ('article', None, None),
+    ('main', None, None),
+    ('div', 'class', 'content'),
+    ('div', 'class', 'article'),
+    ('div', 'data-testid', 'article-content'),
+    ('div', 'class', 'zen-article'),
+    ('div', 'class', 'article-body'),
+)
+
+CONTENT_CSS = ', '.join(
+    tag if not attr else (f'{tag}.{value}' if attr == 'class' else f'{tag}[{attr}="{value}"]')
+    for tag, attr, value in CONTENT_SELECTORS
+)
+
+
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+
+
+def known_encoding(name):
+    """Имя кодировки, если Python её знает, иначе None (опечатки вроде win-1251 встречаются на сайтах)"""
+    if not name:
+        return None
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return None
+    return name
+
+
+def detect_encoding(content_type, content, prefix_size=65536):
+    """Кодировка страницы: из Content-Type, затем из meta тега, затем угадывается по началу документа.
+
+    Неизвестные Python имена кодировок пропускаются — берётся следующий источник.
+    """
+    match = HEADER_CHARSET_RE.search(content_type or '')
+    if match and known_encoding(match.group(1)):
+        return match.group(1)
+    prefix = content[:prefix_size]
+    match = META_CHARSET_RE.search(prefix[:4096])
+    if match and known_encoding(match.group(1).decode('ascii')):
+        return match.group(1).decode('ascii')
+    return known_encoding(chardet.detect(prefix).get('encoding')) or 'utf-8'
+
+
+def _usable_encoding(encoding, content):
+    """Переданная кодировка, а если Python её не знает — определённая по самому документу"""
+    if encoding is None or known_encoding(encoding):
+        return encoding
+    return detect_encoding(None, content)
+
+
+def available_backends():
+    """Список парсеров, доступных в текущем окружении"""
+    backends = ['html.parser']
+    if LXML_AVAILABLE:
+        backends.insert(0, 'lxml')
+    if SELECTOLAX_AVAILABLE:
+        backends.insert(0, 'selectolax')
+    return backends
+
+
+def resolve_backend(name):
+    """Выбирает парсер: 'auto' — самый быстрый из установленных"""
+    backends = available_backends()
+    if name == 'auto':
+        return backends[0]
+    if name not in backends:
+        logger.warning(f"Парсер {name} недоступен, используется {backends[0]}")
+        return backends[0]
+    return name
+
+
+def selector_rank(tag_name, attrs):
+    """Индекс первого подходящего селектора из CONTENT_SELECTORS или None"""
+    for rank, (tag, attr, value) in enumerate(CONTENT_SELECTORS):
+        if tag_name != tag:
+            continue
+        if attr is None:
+            return rank
+        actual = attrs.get(attr)
+        if attr == 'class':
+            classes = actual.split() if isinstance(actual, str) else (actual or [])
+            if value in classes:
+                return rank
+        elif actual == value:
+            return rank
+    return None
+
+
+# Результат разбора: текст, сработавшее правило/селектор, объём текста всей
+# страницы (для подсчёта отброшенного) и ссылка на следующую страницу статьи
+ExtractionResult = namedtuple('ExtractionResult', ['text', 'rule', 'total_chars', 'next_page'])
+
+SELECTOR_NAMES = tuple(f'generic:{css}' for css in CONTENT_CSS.split(', '))
+
+
+def _node_text(node):
+    return '\n'.join(part.strip() for part in node.itertext() if part.strip())
+
+
+def _soup_generic(soup):
+    """Каскад CONTENT_SELECTORS одним обходом дерева: (элемент, имя селектора)"""
+    # Один обход дерева: собираем удаляемые теги (не заходя внутрь) и для
+    # каждого селектора запоминаем первый подходящий элемент в порядке документа
+    removed = []
+    found = [None] * len(CONTENT_SELECTORS)
+    stack = [child for child in reversed(soup.contents) if isinstance(child, Tag)]
+    while stack:
+        tag = stack.pop()
+        if tag.name in REMOVED_TAGS:
+            removed.append(tag)
+            continue
+        rank = selector_rank(tag.name, tag.attrs)
+        if rank is not None and found[rank] is None:
+            found[rank] = tag
+        stack.extend(child for child in reversed(tag.contents) if isinstance(child, Tag))
+
+    for tag in removed:
+        tag.decompose()
+
+    for rank, tag in enumerate(found):
+        if tag is not None:
+            return tag, SELECTOR_NAMES[rank]
+    return None, None
+
+
+def _soup_rule(soup, rule):
+    """Селекторы правила домена (soupsieve): (элемент, ссылка на следующую страницу)"""
+    for tag in soup(list(REMOVED_TAGS)):
+        tag.decompose()
+    if rule.remove:
+        # В обратном порядке документа: вложенные элементы удаляются раньше родителей
+        for tag in reversed(rule.remove.select(soup)):
+            tag.decompose()
+    next_page = None
+    if rule.next_page:
+        link = rule.next_page.select_one(soup)
+        next_page = link.get('href') if link else None
+    for pattern in rule.content:
+        tag = pattern.select_one(soup)
+        if tag is not None:
+            return tag, next_page
+    return None, next_page
+
+
+def _extract_with_soup(content, parser, encoding, rule=None, measure=False):
+    soup = BeautifulSoup(content, parser, from_encoding=encoding if isinstance(content, bytes) else None)
+    next_page = None
+    if rule is not None:
+        article, next_page = _soup_rule(soup, rule)
+        name = rule.name if article is not None else None
+        if article is None:
+            logger.warning(f"Правило {rule.name} не нашло контент, используется общий каскад")
+            article, name = _soup_generic(soup)
+    else:
+        article, name = _soup_generic(soup)
+
+    # Если не нашли, берём весь body
+    body = soup.find('body')
+    root = article or body or soup
+    text = root.get_text(separator='\n', strip=True)
+    total = len((body or soup).get_text(separator='\n', strip=True)) if measure and root is not (body or soup) else len(text)
+    return ExtractionResult(text, name or 'generic:body', total, next_page)
+
+
+def _selectolax_rule(tree, rule):
+    if rule.remove:
+        for node in reversed(tree.css(rule.remove)):
+            node.decompose()
+    next_page = None
+    if rule.next_page:
+        link = tree.css_first(rule.next_page)
+        next_page = link.attributes.get('href') if link else None
+    for css in rule.content:
+        node = tree.css_first(css)
+        if node is not None:
+            return node, next_page
+    return None, next_page
+
+
+def _selectolax_generic(tree):
+    # Все кандидаты за один проход CSS движка, выбираем по приоритету селектора
+    best_rank, article = None, None
+    for node in tree.css(CONTENT_CSS):
+        rank = selector_rank(node.tag, node.attributes)
+        if rank is not None and (best_rank is None or rank < best_rank):
+            best_rank, article = rank, node
+            if rank == 0:
+                break
+    return article, SELECTOR_NAMES[best_rank] if article is not None else None
+
+
+def _extract_with_selectolax(content, encoding, rule=None, measure=False):
+    if isinstance(content, bytes):
+        content = content.decode(_usable_encoding(encoding, content) or 'utf-8', errors='replace')
+    tree = LexborHTMLParser(content)
+    tree.strip_tags(list(REMOVED_TAGS))
+
+    next_page = None
+    article, name = None, None
+    if rule is not None:
+        article, next_page = _selectolax_rule(tree, rule)
+        name = rule.name
+        if article is None:
+            logger.warning(f"Правило {rule.name} не нашло контент, используется общий каскад")
+    if article is None:
+        article, name = _selectolax_generic(tree)
+
+    page = tree.body or tree.root
+    root = article or page
+    if root is None:
+        return ExtractionResult('', 'generic:body', 0, next_page)
+    text = root.text(separator='\n', strip=True)
+    total = len(page.text(separator='\n', strip=True)) if measure and article is not None else len(text)
+    return ExtractionResult(text, name or 'generic:body', total, next_page)
+
+
+def _extract_with_xpath(content, encoding, rule, measure=False):
+    parser = lxml.html.HTMLParser(encoding=_usable_encoding(encoding, content)) if isinstance(content, bytes) else None
+    tree = lxml.html.document_fromstring(content, parser=parser)
+    lxml.etree.strip_elements(tree, *REMOVED_TAGS, with_tail=False)
+    if rule.remove:
+        for node in reversed(rule.remove(tree)):
+            node.drop_tree()
+    next_page = None
+    if rule.next_page:
+        links = rule.next_page(tree)
+        next_page = links[0].get('href') if links else None
+    article = None
+    for xpath in rule.content:
+        nodes = xpath(tree)
+        if nodes:
+            article = nodes[0]
+            break
+    if article is None:
+        # Общий каскад на уже разобранном дереве не повторяем: отдаём на стандартный парсер
+        return None, next_page
+    text = _node_text(article)
+    page = tree.find('body')
+    total = len(_node_text(page if page is not None else tree)) if measure else len(text)
+    return ExtractionResult(text, rule.name, total, next_page), next_page
+
+
+def extract_html(content, backend='html.parser', encoding=None, rule=None):
+    """Разбирает страницу правилом домена (если есть) или общим каскадом, с метриками"""
+    if rule is not None and rule.engine == 'xpath':
+        result, next_page = _extract_with_xpath(content, encoding, rule, measure=True)
+        if result is not None:
+            return result
+        logger.warning(f"Правило {rule.name} не нашло контент, используется общий каскад")
+        return extract_html(content, backend, encoding)._replace(next_page=next_page)
+    if backend == 'selectolax':
+        return _extract_with_selectolax(content, encoding, rule, measure=True)
+    return _extract_with_soup(content, backend, encoding, rule, measure=True)
+
+
+def extract_html_text(content, backend='html.parser', encoding=None):
+    """Возвращает текст основного контента страницы (без построчной очистки)"""
+    if backend == 'selectolax':
+        return _extract_with_selectolax(content, encoding).text
+    return _extract_with_soup(content, backend, encoding).text
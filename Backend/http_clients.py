@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых запрос повторяется с экспоненциальной задержкой
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def create_session(pool_connections=10, pool_maxsize=10, retries=2, backoff_factor=0.5,
+                   allowed_methods=('GET', 'HEAD'), headers=None, connect=None, read=None):
+    """Создаёт requests.Session с пулом keep-alive соединений и повторами.
+
+    pool_connections — сколько хостов держать в пуле, pool_maxsize — сколько
+    соединений держать на один хост. Повторы выполняются для ошибок
+    соединения и статусов RETRY_STATUSES с учётом заголовка Retry-After;
+    после исчерпания попыток возвращается последний ответ, чтобы вызывающий
+    код обработал его через raise_for_status().
+
+    connect и read ограничивают повторы при ошибке установки соединения и
+    при ошибке/таймауте чтения ответа (None — в пределах retries). Для
+    неидемпотентных запросов передайте read=0: запрос, который сервер уже
+    мог выполнить, не отправляется повторно.
+    """
+    retry = Retry(
+        total=retries,
+        connect=connect,
+        read=read,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(allowed_methods),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def create_async_session(limit=100, limit_per_host=20, timeout=60, headers=None):
+    """Создаёт aiohttp.ClientSession с пулом keep-alive соединений (вызывать внутри event loop)"""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers=headers
+    )
+
+
+async def async_request(session, method, url, retries=2, backoff_factor=0.5, **kwargs):
+    """Запрос через aiohttp с повторами, как у create_session: ошибки соединения и RETRY_STATUSES.
+
+    Возвращает ответ (его нужно закрыть, например через async with);
+    после исчерпания попыток — последний ответ или исключение.
+    """
+    for attempt in range(retries + 1):
+        delay = backoff_factor * (2 ** attempt)
+        try:
+            response = await session.request(method, url, **kwargs)
+        except aiohttp.ClientConnectionError as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"Повтор запроса {url} через {delay:.1f} с: {e}")
+        else:
+            if response.status not in RETRY_STATUSES or attempt == retries:
+                return response
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            response.release()
+            logger.warning(f"Повтор запроса {url} через {delay:.1f} с: статус {response.status}")
+        await asyncio.sleep(delay)
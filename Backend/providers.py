@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from response_cleaner import clean_model_response
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderUnavailable(ValueError):
+    """Провайдер не настроен или временно отключён предохранителем"""
+
+
+class CircuitBreaker:
+    """Предохранитель: после failure_threshold ошибок подряд провайдер отключается на reset_timeout секунд.
+
+    По истечении таймаута пропускается один пробный запрос (half_open): успех
+    снова включает провайдер, ошибка отключает его ещё на reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Можно ли отправить запрос (в half_open — только один пробный)"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    def release(self):
+        """Пробный запрос отменён, не дойдя до результата"""
+        with self._lock:
+            self._trial = False
+
+
+class LatencyWindow:
+    """Последние window замеров задержки для расчёта перцентилей"""
+
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p, min_samples=1):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+
+class RewriteProvider:
+    """Провайдер рерайта: функции рерайта целиком и потоком, предохранитель и статистика задержек"""
+
+    def __init__(self, name, rewrite, stream, configured=True, breaker=None, async_rewrite=None):
+        self.name = name
+        self._rewrite = rewrite
+        self._stream = stream
+        self.async_rewrite = async_rewrite  # корутина рерайта для ASGI режима
+        self.configured = configured
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self.first_token_latency = LatencyWindow()
+        self._stats = {'calls': 0, 'errors': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _check(self):
+        if not self.configured:
+            raise ProviderUnavailable(f"Провайдер {self.name} не настроен")
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise ProviderUnavailable(f"Провайдер {self.name} временно недоступен после серии ошибок")
+        self._count('calls')
+
+    def available(self):
+        return self.configured and self.breaker.state != 'open'
+
+    def rewrite(self, article_text, style):
+        self._check()
+        started = time.monotonic()
+        try:
+            result = self._rewrite(article_text, style)
+        except Exception:
+            self._count('errors')
+            self.breaker.record_failure()
+            raise
+        self.latency.add(time.monotonic() - started)
+        self.breaker.record_success()
+        return result
+
+    async def arewrite(self, article_text, style):
+        """Асинхронный рерайт (нужна async_rewrite); отмена задачи не считается ошибкой"""
+        self._check()
+        started = time.monotonic()
+        try:
+            result = await self.async_rewrite(article_text, style)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self._count('errors')
+            self.breaker.record_failure()
+            raise
+        self.latency.add(time.monotonic() - started)
+        self.breaker.record_success()
+        return result
+
+    def stream(self, article_text, style):
+        self._check()
+        started = time.monotonic()
+        first = True
+        try:
+            for delta in self._stream(article_text, style):
+                if first:
+                    self.first_token_latency.add(time.monotonic() - started)
+                    first = False
+                yield delta
+        except GeneratorExit:
+            # Поток закрыт потребителем (например, проиграл гонку) — это не ошибка провайдера
+            self.breaker.release()
+            raise
+        except Exception:
+            self._count('errors')
+            self.breaker.record_failure()
+            raise
+        self.latency.add(time.monotonic() - started)
+        self.breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        p50, p95 = self.latency.percentile(0.5), self.latency.percentile(0.95)
+        return {
+            **stats,
+            'configured': self.configured,
+            'state': self.breaker.state,
+            'latency_p50': round(p50, 3) if p50 is not None else None,
+            'latency_p95': round(p95, 3) if p95 is not None else None
+        }
+
+
+class HedgedProvider:
+    """Провайдер auto: запрос уходит основному провайдеру, а если тот не ответил за
+    перцентиль своей обычной задержки (или упал), параллельно — резервному.
+
+    Побеждает тот, кто первым завершит рерайт (для потока — первым пришлёт
+    текст); проигравший поток закрывается. Провайдеры с открытым
+    предохранителем пропускаются.
+    """
+
+    name = 'auto'
+
+    def __init__(self, providers, percentile=0.95, default_delay=10.0, min_delay=0.5, min_samples=5):
+        self.providers = providers
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._stats = {'calls': 0, 'hedged': 0, 'failovers': 0, 'secondary_wins': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return any(provider.configured for provider in self.providers)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def hedge_delay(self, provider, first_token):
+        window = provider.first_token_latency if first_token else provider.latency
+        delay = window.percentile(self.percentile, self.min_samples)
+        return max(delay if delay is not None else self.default_delay, self.min_delay)
+
+    def _start(self, provider, article_text, style, events):
+        """Запускает попытку в отдельном потоке; события (попытка, тип, значение) идут в events"""
+        cancelled = threading.Event()
+        attempt = (provider, cancelled)
+
+        def run():
+            deltas = provider.stream(article_text, style)
+            try:
+                for delta in deltas:
+                    if cancelled.is_set():
+                        return
+                    events.put((attempt, 'delta', delta))
+                events.put((attempt, 'done', None))
+            except Exception as e:
+                if not cancelled.is_set():
+                    events.put((attempt, 'error', e))
+            finally:
+                deltas.close()
+
+        threading.Thread(target=run, name=f'hedge-{provider.name}', daemon=True).start()
+        return attempt
+
+    def _race(self, article_text, style, first_token):
+        candidates = [provider for provider in self.providers if provider.available()]
+        if not candidates:
+            raise ProviderUnavailable("Нет доступных провайдеров рерайта")
+        self._count('calls')
+
+        events = queue.Queue()
+        buffers = {}
+        attempts = []
+        errors = []
+        winner = None
+
+        def start_next():
+            provider = candidates[len(attempts)]
+            attempt = self._start(provider, article_text, style, events)
+            attempts.append(attempt)
+            buffers[attempt] = []
+            return attempt
+
+        start_next()
+        deadline = time.monotonic() + self.hedge_delay(candidates[0], first_token)
+        try:
+            while True:
+                timeout = None
+                if winner is None and len(attempts) < len(candidates):
+                    timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    attempt, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    logger.info(f"{attempts[-1][0].name} отвечает дольше {self.hedge_delay(attempts[-1][0], first_token):.1f} с, "
+                                f"дублируем запрос в {candidates[len(attempts)].name}")
+                    self._count('hedged')
+                    start_next()
+                    continue
+
+                if winner is None:
+                    if kind == 'error':
+                        logger.warning(f"Ошибка провайдера {attempt[0].name}: {value}")
+                        errors.append(value)
+                        if len(attempts) < len(candidates):
+                            self._count('failovers')
+                            start_next()
+                        elif len(errors) == len(attempts):
+                            raise ValueError(f"Все провайдеры вернули ошибку: {errors[-1]}")
+                        continue
+                    if kind == 'delta':
+                        buffers[attempt].append(value)
+                    if kind == 'done' or first_token:
+                        winner = attempt
+                        if attempt is not attempts[0]:
+                            self._count('secondary_wins')
+                        logger.info(f"Рерайт auto: ответил {attempt[0].name}")
+                        for other in attempts:
+                            if other is not winner:
+                                other[1].set()
+                        yield from buffers[attempt]
+                        if kind == 'done':
+                            return
+                    continue
+
+                if attempt is not winner:
+                    continue
+                if kind == 'delta':
+                    yield value
+                elif kind == 'done':
+                    return
+                else:
+                    raise value
+        finally:
+            for attempt in attempts:
+                attempt[1].set()
+
+    def rewrite(self, article_text, style):
+        return clean_model_response(''.join(self._race(article_text, style, first_token=False)))
+
+    async def arewrite(self, article_text, style):
+        """Асинхронный вариант гонки: попытки — задачи asyncio, проигравшая отменяется"""
+        candidates = [provider for provider in self.providers if provider.available()]
+        if not candidates:
+            raise ProviderUnavailable("Нет доступных провайдеров рерайта")
+        self._count('calls')
+
+        tasks = {}  # задача -> провайдер
+        errors = []
+
+        def start_next():
+            provider = candidates[len(tasks)]
+            tasks[asyncio.ensure_future(provider.arewrite(article_text, style))] = provider
+
+        start_next()
+        pending = set(tasks)
+        timeout = self.hedge_delay(candidates[0], first_token=False) if len(candidates) > 1 else None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"{candidates[len(tasks) - 1].name} отвечает дольше {timeout:.1f} с, "
+                                f"дублируем запрос в {candidates[len(tasks)].name}")
+                    self._count('hedged')
+                    start_next()
+                    pending = {task for task in tasks if not task.done()}
+                    timeout = None
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] is not candidates[0]:
+                            self._count('secondary_wins')
+                        logger.info(f"Рерайт auto: ответил {tasks[task].name}")
+                        return task.result()
+                    logger.warning(f"Ошибка провайдера {tasks[task].name}: {task.exception()}")
+                    errors.append(task.exception())
+                if len(tasks) < len(candidates):
+                    self._count('failovers')
+                    start_next()
+                    pending = {task for task in tasks if not task.done()}
+                    timeout = None
+                elif not pending:
+                    raise ValueError(f"Все провайдеры вернули ошибку: {errors[-1]}")
+                else:
+                    timeout = None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stream(self, article_text, style):
+        return self._race(article_text, style, first_token=True)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,205 @@
+import re
+
+# Распространённые предисловия модели (применяются по порядку, регистронезависимо)
+PREFIXES_TO_REMOVE = [
+    r"^вот переписанный текст:?\s*",
+    r"^переписанный текст:?\s*",
+    r"^вот вариант:?\s*",
+    r"^вот переписанный вариант:?\s*",
+    r"^переписанный вариант:?\s*",
+    r"^вот текст:?\s*",
+    r"^текст в стиле:?\s*",
+    r"^думаю:?\s*",
+    r"^я думаю:?\s*",
+    r"^можно переписать так:?\s*",
+    r"^переписанный вариант текста:?\s*",
+    r"^вот как можно переписать:?\s*",
+    r"^вот переписанный:?\s*",
+    r"^переписанный:?\s*",
+    r"^вот:?\s*",
+    r"^think:?\s*",
+    r"^thinking:?\s*",
+    r"^я думаю,?\s*",
+    r"^думаю,?\s*",
+]
+
+
+# Блоки рассуждений вырезаются вместе с содержимым, одиночные теги — сами по себе.
+# Одно регулярное выражение за один проход заменяет шесть последовательных re.sub
+TAGS_RE = re.compile(
+    r'<(think|reasoning|thinking)>.*?</\1>|</?(?:redacted_reasoning|reasoning|thinking)>',
+    re.DOTALL | re.IGNORECASE
+)
+
+# PREFIX_CHAINS[i] — альтернатива из предисловий с i-го по последнее. Предисловия
+# снимаются в порядке списка, каждое не более одного раза, поэтому после снятия
+# предисловия с индексом i дальше ищем только среди PREFIX_CHAINS[i + 1]
+PREFIX_CHAINS = [
+    re.compile('|'.join(f'(?P<p{i}>{PREFIXES_TO_REMOVE[i]})' for i in range(start, len(PREFIXES_TO_REMOVE))), re.IGNORECASE)
+    for start in range(len(PREFIXES_TO_REMOVE))
+]
+
+PARENTHESIZED_THOUGHT_RE = re.compile(
+    r'\([^)]*(?:думаю|я думаю|можно|вариант|переписанный|think|thinking)[^)]*\)',
+    re.IGNORECASE
+)
+EDGE_QUOTES_RE = re.compile(r'^["\'«»]|["\'«»]$')
+LEADING_QUOTE_RE = re.compile(r'^["\'«»]')
+THOUGHT_LINE_RE = re.compile(
+    r'(?:думаю|я думаю|можно|вариант|переписанный|вот|это|так|например|то есть|think|thinking)'
+    r'|\(.*(?:думаю|можно|вариант).*\)$',
+    re.IGNORECASE
+)
+
+
+def strip_prefixes(text):
+    """Снимает предисловия из PREFIXES_TO_REMOVE по порядку списка"""
+    start = 0
+    if text[:1].isspace():
+        # Первое предисловие проверялось до strip() и не могло совпасть с пробелом в начале
+        text = text.strip()
+        start = 1
+    while start < len(PREFIX_CHAINS):
+        match = PREFIX_CHAINS[start].match(text)
+        if not match:
+            break
+        text = text[match.end():].strip()
+        start = int(match.lastgroup[1:]) + 1
+    return text.strip()
+
+
+def clean_model_response(text):
+    """Очищает ответ модели от мыслей, комментариев и лишних фраз.
+
+    Все выражения скомпилированы заранее. Теги рассуждений вырезаются за
+    один проход слева направо; для вложенных вперемешку блоков разных
+    типов (<reasoning>..<think>..</reasoning>..</think>) результат может
+    отличаться от прежней поочерёдной обработки, на реальных ответах
+    вывод совпадает (см. benchmarks/bench_clean_model_response.py).
+    """
+    if not text:
+        return ""
+    
+    original_text = text
+    text = text.strip()
+    
+    # Удаляем теги reasoning (включая содержимое между ними) и оставшиеся одиночные теги
+    if '<' in text:
+        text = TAGS_RE.sub('', text)
+    
+    # Удаляем распространённые предисловия (регистронезависимо)
+    text = strip_prefixes(text)
+    
+    # Удаляем мысли в скобках
+    if '(' in text:
+        text = PARENTHESIZED_THOUGHT_RE.sub('', text)
+    
+    # Удаляем кавычки в начале и конце, если они есть
+    text = EDGE_QUOTES_RE.sub('', text).strip()
+    
+    # Удаляем строки, которые выглядят как мысли
+    cleaned_lines = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        
+        # Пропускаем короткие строки, которые явно являются мыслями
+        if len(line) < 150 and THOUGHT_LINE_RE.match(line):
+            continue
+        
+        cleaned_lines.append(line)
+    
+    result = '\n'.join(cleaned_lines).strip()
+    
+    # Если после очистки осталось слишком мало текста, возвращаем оригинал
+    if len(result) < 20:
+        return original_text.strip()
+    
+    return result
+
+
+class StreamingResponseCleaner:
+    """Инкрементальная очистка потокового ответа модели.
+
+    feed() принимает очередной фрагмент и возвращает текст, который уже
+    можно показать: блоки <think>/<reasoning>/<thinking> вырезаются по мере
+    поступления (неполный тег на границе фрагментов придерживается), а
+    предисловие в начале ответа снимается, как только накоплено
+    head_size символов или первая строка. Построчная фильтрация мыслей
+    требует полного текста, поэтому итог всё равно прогоняется через
+    clean_model_response.
+    """
+
+    BLOCK_TAGS = {'<think>': '</think>', '<reasoning>': '</reasoning>', '<thinking>': '</thinking>'}
+    ORPHAN_TAGS = (
+        '<redacted_reasoning>', '</redacted_reasoning>',
+        '</reasoning>', '</thinking>', '</think>'
+    )
+
+    def __init__(self, head_size=40):
+        self.head_size = head_size
+        self._buffer = ''
+        self._closing_tag = None  # закрывающий тег блока, внутри которого мы находимся
+        self._head = ''
+        self._head_done = False
+        self._known_tags = tuple(self.BLOCK_TAGS) + self.ORPHAN_TAGS
+
+    def _scan(self, final=False):
+        """Вырезает теги из буфера и возвращает текст до первого возможного неполного тега"""
+        out = []
+        while self._buffer:
+            lowered = self._buffer.lower()
+            if self._closing_tag:
+                end = lowered.find(self._closing_tag)
+                if end == -1:
+                    # Держим хвост, в котором может начинаться закрывающий тег
+                    self._buffer = '' if final else self._buffer[-(len(self._closing_tag) - 1):]
+                    break
+                self._buffer = self._buffer[end + len(self._closing_tag):]
+                self._closing_tag = None
+                continue
+
+            pos = lowered.find('<')
+            if pos == -1:
+                out.append(self._buffer)
+                self._buffer = ''
+                break
+            out.append(self._buffer[:pos])
+            rest = lowered[pos:]
+            tag = next((t for t in self._known_tags if rest.startswith(t)), None)
+            if tag:
+                self._closing_tag = self.BLOCK_TAGS.get(tag)
+                self._buffer = self._buffer[pos + len(tag):]
+                continue
+            if not final and any(t.startswith(rest) for t in self._known_tags):
+                self._buffer = self._buffer[pos:]
+                break
+            out.append(self._buffer[pos])
+            self._buffer = self._buffer[pos + 1:]
+        return ''.join(out)
+
+    def _strip_head(self, final=False):
+        """Снимает предисловие, когда начало ответа накоплено"""
+        if not final and len(self._head.strip()) < self.head_size and '\n' not in self._head.strip():
+            return ''
+        # Хвостовые пробелы сохраняем: к ним приклеится следующий фрагмент
+        head = self._head.lstrip()
+        body = head.rstrip()
+        text = LEADING_QUOTE_RE.sub('', strip_prefixes(body) + head[len(body):])
+        self._head = ''
+        self._head_done = True
+        return text
+
+    def _emit(self, text, final=False):
+        if self._head_done:
+            return text
+        self._head += text
+        return self._strip_head(final)
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        return self._emit(self._scan())
+
+    def finish(self):
+        return self._emit(self._scan(final=True), final=True)
@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def rewrite_cache_key(article_text, style, provider, model, prompt_version, mode='single'):
+    """Ключ результата рерайта: хэш текста + стиль, провайдер, модель, версия промпта и режим"""
+    text_hash = hashlib.sha256(article_text.encode('utf-8')).hexdigest()
+    return hashlib.sha256(
+        f"{text_hash}:{style}:{provider}:{model}:{prompt_version}:{mode}".encode('utf-8')
+    ).hexdigest()
+
+
+class RewriteCache:
+    """LRU кэш результатов рерайта с опциональным хранением в SQLite"""
+
+    def __init__(self, max_entries=512, db_path=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS rewrite_cache ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS rewrite_cache_created ON rewrite_cache(created_at)")
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, text FROM rewrite_cache ORDER BY created_at DESC LIMIT ?",
+                (max_entries,)
+            ).fetchall()
+            for key, text in reversed(rows):
+                self._entries[key] = text
+            logger.info(f"Загружено результатов рерайта из кэша: {len(self._entries)}")
+
+    def get(self, key):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+            if self._db:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO rewrite_cache (key, text, created_at) VALUES (?, ?, ?)",
+                        (key, text, time.time())
+                    )
+                    self._db.execute(
+                        "DELETE FROM rewrite_cache WHERE key NOT IN "
+                        "(SELECT key FROM rewrite_cache ORDER BY created_at DESC LIMIT ?)",
+                        (self.max_entries,)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Ошибка сохранения кэша рерайта: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'size': len(self._entries),
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0
+            }
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
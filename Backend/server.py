@@ -1,20 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 import json
 import logging
-import asyncio
-import re
+import atexit
 import requests
+import queue
 import secrets
+import sys
+import threading
 import time
-from bs4 import BeautifulSoup
-from aiogram import Bot
-from aiogram.exceptions import TelegramAPIError
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
 from dotenv import load_dotenv
+from article_cache import ArticleCache, content_hash, normalize_url
+from bot_runtime import BotRuntime
+from broadcast_jobs import BroadcastJobStore
+from chunking import CHUNK_SEPARATOR, estimate_tokens, rewrite_chunks, split_into_chunks
+from extraction_rules import ExtractionRules
+from html_extraction import detect_encoding, extract_html, resolve_backend
+from http_clients import create_session
+from providers import CircuitBreaker, HedgedProvider, ProviderUnavailable, RewriteProvider
+from response_cleaner import StreamingResponseCleaner, clean_model_response
+from rewrite_cache import RewriteCache, rewrite_cache_key
+from telegram_sender import TelegramRateLimiter, send_to_channels
+from token_store import TokenStore, SnapshotPersistence, JournalPersistence
 
 # Загружаем .env из корня проекта или из папки Backend
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Общие с ботом модули лежат в папке Shared в корне проекта
+sys.path.append(BASE_DIR)
+from Shared.channel_registry import ChannelRegistry
+from Shared.channel_validation import ChatInfoCache, mark_channels, validate_channels
+from Shared.sqlite_storage import SendHistory, SQLiteChannelRegistry, SQLiteStorage, SQLiteTokenPersistence
+
 env_path = os.path.join(BASE_DIR, '.env')
 if not os.path.exists(env_path):
     env_path = os.path.join(BASE_DIR, 'BOT_TOKEN.env')
@@ -39,6 +59,10 @@ if os.path.exists(yandex_env_path):
 app = Flask(__name__)
 CORS(app)  # Разрешаем CORS для запросов с сайта
 
+# Режим сервера: wsgi — Flask (python server.py), asgi — асинхронные обработчики
+# основных маршрутов под uvicorn (см. asgi.py), остальные маршруты обслуживает Flask
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -59,6 +83,7 @@ if not os.path.exists(TELEGRAM_BOT_DIR):
 
 CHANNELS_FILE = os.path.join(TELEGRAM_BOT_DIR, "channels.json")
 AUTH_TOKENS_FILE = os.path.join(TELEGRAM_BOT_DIR, "auth_tokens.json")
+AUTH_TOKENS_JOURNAL_FILE = os.path.join(TELEGRAM_BOT_DIR, "auth_tokens.journal")
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 if not BOT_TOKEN:
@@ -102,90 +127,99 @@ if OPENROUTER_API_KEY:
 else:
     logger.warning("OpenRouter API не настроен. Добавьте OPENROUTER_API_KEY в .env")
 
-# Bot будет создаваться для каждого запроса, чтобы избежать проблем с сессией
+# Один Bot с пулом соединений живёт в фоновом event loop и обслуживает все запросы
+TELEGRAM_CONNECTION_LIMIT = int(os.getenv('TELEGRAM_CONNECTION_LIMIT', 100))
+bot_runtime = BotRuntime(BOT_TOKEN, connection_limit=TELEGRAM_CONNECTION_LIMIT)
+bot_runtime.start()
+atexit.register(bot_runtime.shutdown)
 logger.info("Aiogram Bot готов к использованию")
 
+# Рассылка: параллельная отправка с учётом лимитов Telegram (общий лимит и лимит на чат)
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv('TELEGRAM_SEND_CONCURRENCY', 10))
+TELEGRAM_SEND_MAX_RETRIES = int(os.getenv('TELEGRAM_SEND_MAX_RETRIES', 3))
+telegram_rate_limiter = TelegramRateLimiter(
+    global_rate=float(os.getenv('TELEGRAM_GLOBAL_RATE', 30)),
+    per_chat_per_minute=float(os.getenv('TELEGRAM_CHAT_RATE_PER_MINUTE', 20))
+)
+
+# Фоновые задачи рассылки (POST /api/send-article с "async": true)
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', 4))
+BROADCAST_JOB_RETENTION = int(os.getenv('BROADCAST_JOB_RETENTION', 3600))
+broadcast_jobs = BroadcastJobStore(retention=BROADCAST_JOB_RETENTION)
+broadcast_executor = ThreadPoolExecutor(max_workers=BROADCAST_WORKERS, thread_name_prefix='broadcast')
+atexit.register(broadcast_executor.shutdown, wait=False, cancel_futures=True)
 
-def load_channels():
-    """Загружает список каналов из файла"""
-    if os.path.exists(CHANNELS_FILE):
-        try:
-            with open(CHANNELS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('channels', [])
-        except Exception as e:
-            logger.error(f"Ошибка загрузки каналов: {e}")
-            return []
-    return []
 
+# Хранилище данных: json — файлы в папке TelegramBot, sqlite — общая с ботом база в режиме WAL
+# (каналы, токены авторизации и история отправок; JSON файлы переносятся при первом запуске)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+STORAGE_DB_FILE = os.getenv('STORAGE_DB_FILE') or os.path.join(TELEGRAM_BOT_DIR, 'phoenix_lab.db')
+database = None
+send_history = None
+if STORAGE_BACKEND == 'sqlite':
+    database = SQLiteStorage(STORAGE_DB_FILE)
+    database.migrate_json(CHANNELS_FILE, AUTH_TOKENS_FILE)
+    send_history = SendHistory(database)
+    logger.info(f"Используется SQLite база: {STORAGE_DB_FILE}")
+
+# Каналы рассылки: общий с ботом реестр, файл (или база) перечитывается только при изменении
+channel_registry = SQLiteChannelRegistry(database) if database else ChannelRegistry(CHANNELS_FILE)
+
+# Проверка каналов: сведения о канале и правах бота кэшируются на CHAT_INFO_TTL секунд,
+# недоступные каналы помечаются status=dead и пропускаются при рассылке
+CHAT_INFO_TTL = int(os.getenv('CHAT_INFO_TTL', 600))
+CHANNEL_VALIDATION_CONCURRENCY = int(os.getenv('CHANNEL_VALIDATION_CONCURRENCY', 5))
+chat_info_cache = ChatInfoCache(ttl=CHAT_INFO_TTL)
+
+
+# Хранилище токенов авторизации: словарь в памяти + отложенная запись на диск
+AUTH_TOKEN_TTL = 300  # Токен действителен 5 минут
+AUTH_TOKENS_FLUSH_INTERVAL = float(os.getenv('AUTH_TOKENS_FLUSH_INTERVAL', 1.0))
+AUTH_TOKENS_PERSISTENCE = os.getenv('AUTH_TOKENS_PERSISTENCE', 'sqlite' if database else 'snapshot')  # snapshot, journal или sqlite
+AUTH_TOKENS_COMPACT_EVERY = int(os.getenv('AUTH_TOKENS_COMPACT_EVERY', 1000))
+AUTH_WAIT_TIMEOUT = 25  # Максимальное время long-poll запроса (секунды)
+AUTH_WAIT_HEARTBEAT = 15  # Интервал keep-alive комментариев в SSE потоке (секунды)
+
+if AUTH_TOKENS_PERSISTENCE == 'sqlite' and database:
+    token_persistence = SQLiteTokenPersistence(database)
+elif AUTH_TOKENS_PERSISTENCE == 'journal':
+    token_persistence = JournalPersistence(
+        AUTH_TOKENS_FILE,
+        AUTH_TOKENS_JOURNAL_FILE,
+        compact_every=AUTH_TOKENS_COMPACT_EVERY
+    )
+else:
+    token_persistence = SnapshotPersistence(AUTH_TOKENS_FILE)
+logger.info(f"Хранение токенов авторизации: {AUTH_TOKENS_PERSISTENCE}")
+
+token_store = TokenStore(token_persistence, flush_interval=AUTH_TOKENS_FLUSH_INTERVAL)
 
-# Хранилище токенов авторизации
-auth_tokens = {}
 
 def load_auth_tokens():
     """Загружает токены из файла"""
-    global auth_tokens
-    if os.path.exists(AUTH_TOKENS_FILE):
-        try:
-            with open(AUTH_TOKENS_FILE, 'r', encoding='utf-8') as f:
-                loaded_tokens = json.load(f)
-                # Удаляем истекшие токены
-                current_time = time.time()
-                auth_tokens = {
-                    k: v for k, v in loaded_tokens.items()
-                    if v.get('expires_at', 0) > current_time
-                }
-                logger.info(f"Загружено активных токенов: {len(auth_tokens)}")
-        except json.JSONDecodeError:
-            logger.warning("Файл токенов поврежден, создаю новый")
-            auth_tokens = {}
-        except Exception as e:
-            logger.error(f"Ошибка загрузки токенов: {e}")
-            auth_tokens = {}
-    else:
-        auth_tokens = {}
+    token_store.load()
 
 
 def save_auth_tokens():
     """Сохраняет токены в файл"""
-    try:
-        os.makedirs(os.path.dirname(AUTH_TOKENS_FILE), exist_ok=True)
-        with open(AUTH_TOKENS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(auth_tokens, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Ошибка сохранения токенов: {e}")
+    token_store.flush()
 
 
 def generate_auth_token():
     """Генерирует новый токен авторизации"""
-    global auth_tokens
-    load_auth_tokens()
+    token_store.purge_expired()
     
     token = secrets.token_urlsafe(32)
-    expires_at = time.time() + 300  # Токен действителен 5 минут
-    auth_tokens[token] = {
-        'expires_at': expires_at,
-        'status': 'pending',  # pending, authorized, expired
-        'user_data': None
-    }
-    save_auth_tokens()
+    token_store.create(token, AUTH_TOKEN_TTL)  # status: pending, authorized, expired
     logger.info(f"Сгенерирован новый токен: {token[:10]}...")
     return token
 
 
 def verify_auth_token(token):
     """Проверяет токен и возвращает данные пользователя"""
-    load_auth_tokens()
+    token_data = token_store.get(token)
     
-    if token not in auth_tokens:
-        return None
-    
-    token_data = auth_tokens[token]
-    
-    # Проверяем срок действия
-    if token_data['expires_at'] < time.time():
-        del auth_tokens[token]
-        save_auth_tokens()
+    if token_data is None:
         return None
     
     # Проверяем статус
@@ -197,152 +231,217 @@ def verify_auth_token(token):
 
 def authorize_token(token, user_data):
     """Авторизует токен с данными пользователя"""
-    global auth_tokens
-    load_auth_tokens()
-    
-    if token not in auth_tokens:
+    if not token_store.update(
+        token,
+        status='authorized',
+        user_data=user_data,
+        authorized_at=time.time()
+    ):
         return False
     
-    auth_tokens[token]['status'] = 'authorized'
-    auth_tokens[token]['user_data'] = user_data
-    auth_tokens[token]['authorized_at'] = time.time()
-    save_auth_tokens()
     logger.info(f"Токен {token[:10]}... успешно авторизован")
     return True
 
 
-# Загружаем токены при старте
+# Загружаем токены при старте и запускаем фоновую запись
 load_auth_tokens()
+token_store.start()
+atexit.register(token_store.close)
 
 
-def clean_model_response(text):
-    """Очищает ответ модели от мыслей, комментариев и лишних фраз"""
-    if not text:
-        return ""
-    
-    original_text = text
-    text = text.strip()
-    
-    # Удаляем теги reasoning (включая содержимое между ними)
-    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r'<reasoning>.*?</reasoning>', '', text, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r'<thinking>.*?</thinking>', '', text, flags=re.DOTALL | re.IGNORECASE)
-    # Удаляем оставшиеся одиночные теги
-    text = re.sub(r'</?redacted_reasoning>', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'</?reasoning>', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'</?thinking>', '', text, flags=re.IGNORECASE)
-    
-    # Удаляем распространённые предисловия (регистронезависимо)
-    prefixes_to_remove = [
-        r"^вот переписанный текст:?\s*",
-        r"^переписанный текст:?\s*",
-        r"^вот вариант:?\s*",
-        r"^вот переписанный вариант:?\s*",
-        r"^переписанный вариант:?\s*",
-        r"^вот текст:?\s*",
-        r"^текст в стиле:?\s*",
-        r"^думаю:?\s*",
-        r"^я думаю:?\s*",
-        r"^можно переписать так:?\s*",
-        r"^переписанный вариант текста:?\s*",
-        r"^вот как можно переписать:?\s*",
-        r"^вот переписанный:?\s*",
-        r"^переписанный:?\s*",
-        r"^вот:?\s*",
-        r"^think:?\s*",
-        r"^thinking:?\s*",
-        r"^я думаю,?\s*",
-        r"^думаю,?\s*",
-    ]
-    
-    for prefix in prefixes_to_remove:
-        text = re.sub(prefix, '', text, flags=re.IGNORECASE).strip()
-    
-    # Удаляем мысли в скобках
-    text = re.sub(r'\([^)]*(?:думаю|я думаю|можно|вариант|переписанный|think|thinking)[^)]*\)', '', text, flags=re.IGNORECASE)
-    
-    # Удаляем кавычки в начале и конце, если они есть
-    text = re.sub(r'^["\'«»]|["\'«»]$', '', text).strip()
-    
-    # Удаляем строки, которые выглядят как мысли
-    lines = text.split('\n')
-    cleaned_lines = []
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
+# Общие HTTP сессии с пулом keep-alive соединений и повторами при 429/5xx
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.5))
+article_http = create_session(
+    pool_connections=int(os.getenv('ARTICLE_HTTP_POOL_HOSTS', 20)),
+    pool_maxsize=int(os.getenv('ARTICLE_HTTP_POOL_SIZE', 4)),
+    retries=HTTP_RETRIES,
+    backoff_factor=HTTP_RETRY_BACKOFF
+)
+openrouter_http = create_session(
+    pool_connections=1,
+    pool_maxsize=int(os.getenv('OPENROUTER_HTTP_POOL_SIZE', 20)),
+    retries=HTTP_RETRIES,
+    backoff_factor=HTTP_RETRY_BACKOFF,
+    allowed_methods=('POST',),
+    read=0  # таймаут ответа модели не повторяем: запрос уже мог быть выполнен и оплачен
+)
+atexit.register(article_http.close)
+atexit.register(openrouter_http.close)
+
+
+# Парсер HTML: auto (selectolax, lxml или html.parser — что установлено), либо конкретный
+HTML_PARSER_BACKEND = resolve_backend(os.getenv('HTML_PARSER', 'auto'))
+logger.info(f"HTML парсер: {HTML_PARSER_BACKEND}")
+
+# Правила извлечения статей для конкретных доменов (селекторы, удаляемые блоки, пагинация)
+EXTRACTION_RULES_FILE = os.getenv('EXTRACTION_RULES_FILE') or os.path.join(BASE_DIR, 'Backend', 'extraction_rules.json')
+extraction_rules = ExtractionRules.load(EXTRACTION_RULES_FILE, HTML_PARSER_BACKEND)
+
+# Кэш извлечённого текста статей (ARTICLE_CACHE_DIR включает дисковый уровень)
+article_cache = ArticleCache(
+    ttl=int(os.getenv('ARTICLE_CACHE_TTL', 600)),
+    max_entries=int(os.getenv('ARTICLE_CACHE_SIZE', 256)),
+    cache_dir=os.getenv('ARTICLE_CACHE_DIR') or None
+)
+
+# Кэш результатов рерайта. Увеличьте версию при изменении промптов, чтобы не отдавать старые результаты
+REWRITE_PROMPT_VERSION = 1
+
+# Рерайт по частям: длинный текст делится по абзацам на куски до REWRITE_CHUNK_TOKENS
+# токенов, которые переписываются параллельно (не больше REWRITE_CHUNK_WORKERS одновременно).
+# REWRITE_CHUNKED: auto — только если текст не помещается в один запрос, always, never
+REWRITE_MAX_TEXT_LENGTH = 12000
+REWRITE_CHUNKED = os.getenv('REWRITE_CHUNKED', 'auto')
+REWRITE_CHUNK_TOKENS = int(os.getenv('REWRITE_CHUNK_TOKENS', 1500))
+REWRITE_CHUNK_WORKERS = int(os.getenv('REWRITE_CHUNK_WORKERS', 4))
+rewrite_executor = ThreadPoolExecutor(max_workers=REWRITE_CHUNK_WORKERS, thread_name_prefix='rewrite-chunk')
+rewrite_cache = RewriteCache(
+    max_entries=int(os.getenv('REWRITE_CACHE_SIZE', 512)),
+    db_path=os.getenv('REWRITE_CACHE_DB') or None
+)
+atexit.register(rewrite_cache.close)
+
+
+ARTICLE_MAX_BYTES = int(os.getenv('ARTICLE_MAX_BYTES', 5 * 1024 * 1024))
+
+ARTICLE_REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
+}
+
+
+# Загруженная страница статьи: тело (возможно обрезанное), кодировка и заголовки ответа
+ArticlePage = namedtuple('ArticlePage', ['content', 'encoding', 'headers', 'truncated'])
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'application/xml', 'text/xml', 'text/plain')
+
+
+def fetch_article_page(url, etag=None, last_modified=None):
+    """Загружает страницу статьи потоком, не больше ARTICLE_MAX_BYTES (условный GET, если есть валидаторы).
+
+    Возвращает ArticlePage или None, если сервер ответил 304 Not Modified.
+    Страница, превысившая лимит, обрезается и всё равно передаётся на разбор.
+    """
+    headers = dict(ARTICLE_REQUEST_HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    with article_http.get(url, headers=headers, timeout=15, stream=True) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
         
-        # Пропускаем строки, которые явно являются мыслями
-        thought_patterns = [
-            r'^(думаю|я думаю|можно|вариант|переписанный|вот|это|так|например|то есть|think|thinking)',
-            r'^\(.*(думаю|можно|вариант).*\)$'
-        ]
+        # Не скачиваем тело, если это не HTML (PDF, картинка, архив...)
+        check_article_content_type(response.headers.get('Content-Type', ''))
         
-        is_thought = False
-        for pattern in thought_patterns:
-            if re.match(pattern, line, re.IGNORECASE) and len(line) < 150:
-                is_thought = True
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=65536):
+            chunks.append(chunk)
+            size += len(chunk)
+            # Читаем хотя бы байт сверх лимита, иначе страницу ровно в лимит не отличить от обрезанной
+            if size > ARTICLE_MAX_BYTES:
                 break
-        
-        if not is_thought:
-            cleaned_lines.append(line)
+        return make_article_page(url, chunks, response.headers)
+
+
+def check_article_content_type(content_type):
+    """Прерывает загрузку, если ответ не HTML документ"""
+    mime_type = content_type.split(';')[0].strip().lower()
+    if mime_type and mime_type not in HTML_CONTENT_TYPES:
+        raise ValueError(f"Страница не является HTML документом (Content-Type: {mime_type})")
+
+
+def make_article_page(url, chunks, headers):
+    """Собирает ArticlePage из прочитанных кусков тела (не больше ARTICLE_MAX_BYTES)"""
+    content = b''.join(chunks)
+    truncated = len(content) > ARTICLE_MAX_BYTES
+    if truncated:
+        content = content[:ARTICLE_MAX_BYTES]
+        logger.warning(f"Страница больше {ARTICLE_MAX_BYTES} байт, разбираем первые {len(content)}: {url}")
+    content_type = headers.get('Content-Type', '')
+    return ArticlePage(content, detect_encoding(content_type, content), headers, truncated)
+
+
+def parse_article_html(content, encoding=None, rule=None):
+    """Извлекает текст статьи из HTML (правилом домена или общим каскадом)"""
+    result = extract_html(content, HTML_PARSER_BACKEND, encoding, rule)
+    extraction_rules.record(result)
     
-    result = '\n'.join(cleaned_lines).strip()
+    # Очищаем текст от лишних пробелов и пустых строк
+    lines = [line.strip() for line in result.text.split('\n') if line.strip() and len(line.strip()) > 3]
+    cleaned_text = '\n'.join(lines)
     
-    # Если после очистки осталось слишком мало текста, возвращаем оригинал
-    if len(result) < 20:
-        return original_text.strip()
+    if not cleaned_text or len(cleaned_text) < 50:
+        raise ValueError(f"Извлечённый текст слишком короткий или пуст ({len(cleaned_text) if cleaned_text else 0} символов)")
     
-    return result
+    return result._replace(text=cleaned_text)
+
+
+def extract_next_pages(url, next_page, rule):
+    """Дочитывает следующие страницы статьи по правилу домена (не больше rule.max_pages)"""
+    texts = []
+    visited = {normalize_url(url)}
+    while next_page and len(visited) < rule.max_pages:
+        page_url = urljoin(url, next_page)
+        if normalize_url(page_url) in visited:
+            break
+        visited.add(normalize_url(page_url))
+        try:
+            page = fetch_article_page(page_url)
+            result = parse_article_html(page.content, page.encoding, rule)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Не удалось загрузить страницу {page_url} статьи {url}: {e}")
+            break
+        texts.append(result.text)
+        url, next_page = page_url, result.next_page
+    return texts
+
+
+def extract_page_text(url, cache_key, page):
+    """Разбирает загруженную страницу (или берёт текст по хэшу HTML) и кладёт результат в кэш"""
+    digest = content_hash(page.content)
+    cleaned_text = article_cache.text_for_content(digest)
+    if cleaned_text is None:
+        rule = extraction_rules.for_url(url)
+        result = parse_article_html(page.content, page.encoding, rule)
+        cleaned_text = result.text
+        if rule is not None and rule.max_pages > 1 and result.next_page:
+            cleaned_text = '\n'.join([cleaned_text] + extract_next_pages(url, result.next_page, rule))
+    
+    article_cache.put(
+        cache_key,
+        digest,
+        cleaned_text,
+        etag=page.headers.get('ETag'),
+        last_modified=page.headers.get('Last-Modified')
+    )
+    return cleaned_text
 
 
 def extract_article_text(url):
-    """Извлекает текст статьи из URL"""
+    """Извлекает текст статьи из URL (с кэшированием по URL и содержимому страницы)"""
+    cache_key = normalize_url(url)
+    entry, fresh = article_cache.lookup(cache_key)
+    if entry and fresh:
+        logger.info(f"Текст статьи взят из кэша: {url}")
+        return entry['text']
+    
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
-        }
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding or 'utf-8'
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Удаляем скрипты и стили
-        for script in soup(["script", "style", "nav", "header", "footer"]):
-            script.decompose()
-        
-        # Пытаемся найти основной контент статьи
-        # Для Dzen.ru и других платформ
-        article = (soup.find('article') or 
-                  soup.find('main') or 
-                  soup.find('div', class_='content') or
-                  soup.find('div', class_='article') or
-                  soup.find('div', {'data-testid': 'article-content'}) or
-                  soup.find('div', class_='zen-article') or
-                  soup.find('div', class_='article-body'))
-        
-        if article:
-            text = article.get_text(separator='\n', strip=True)
-        else:
-            # Если не нашли, берём весь body, но удаляем навигацию и футеры
-            body = soup.find('body')
-            if body:
-                text = body.get_text(separator='\n', strip=True)
-            else:
-                text = soup.get_text(separator='\n', strip=True)
-        
-        # Очищаем текст от лишних пробелов и пустых строк
-        lines = [line.strip() for line in text.split('\n') if line.strip() and len(line.strip()) > 3]
-        cleaned_text = '\n'.join(lines)
-        
-        if not cleaned_text or len(cleaned_text) < 50:
-            raise ValueError(f"Извлечённый текст слишком короткий или пуст ({len(cleaned_text) if cleaned_text else 0} символов)")
+        page = fetch_article_page(
+            url,
+            etag=entry['etag'] if entry else None,
+            last_modified=entry['last_modified'] if entry else None
+        )
+        if page is None:
+            logger.info(f"Страница не изменилась (304), используем кэш: {url}")
+            article_cache.revalidated(cache_key)
+            return entry['text']
         
-        return cleaned_text
+        return extract_page_text(url, cache_key, page)
     except requests.exceptions.RequestException as e:
         logger.error(f"Ошибка HTTP запроса к {url}: {e}")
         raise ValueError(f"Не удалось загрузить страницу: {str(e)}")
@@ -351,11 +450,8 @@ def extract_article_text(url):
         raise
 
 
-def rewrite_article_with_yandex(article_text, style):
-    """Рерайтит статью через YandexGPT API"""
-    if not yandex_client:
-        raise ValueError("YandexGPT API не настроен. Добавьте YANDEX_CLOUD_API_KEY в .env")
-    
+def build_yandex_prompt(article_text, style):
+    """Формирует промпт для YandexGPT"""
     style_prompts = {
         'scientific': 'Перепиши статью в научно-деловом стиле, сохраняя основную информацию и факты. Ответ должен быть на русском языке.',
         'meme': 'Перепиши статью в мемном стиле, сделай её более развлекательной и юмористической. Ответ должен быть на русском языке.',
@@ -363,15 +459,22 @@ def rewrite_article_with_yandex(article_text, style):
     }
     
     prompt = style_prompts.get(style, style_prompts['casual'])
-    full_prompt = f"{prompt}\n\nВАЖНО: Весь ответ должен быть на русском языке. Не используй английский язык.\n\nТекст статьи:\n{article_text}"
+    
+    # Ограничиваем длину текста (длинные статьи рерайтятся по частям, см. rewrite_article_text)
+    if len(article_text) > REWRITE_MAX_TEXT_LENGTH:
+        article_text = article_text[:REWRITE_MAX_TEXT_LENGTH] + "..."
+    
+    return f"{prompt}\n\nВАЖНО: Весь ответ должен быть на русском языке. Не используй английский язык.\n\nТекст статьи:\n{article_text}"
+
+
+def rewrite_article_with_yandex(article_text, style):
+    """Рерайтит статью через YandexGPT API"""
+    if not yandex_client:
+        raise ValueError("YandexGPT API не настроен. Добавьте YANDEX_CLOUD_API_KEY в .env")
+    
+    full_prompt = build_yandex_prompt(article_text, style)
     
     try:
-        # Ограничиваем длину текста
-        max_text_length = 12000
-        if len(article_text) > max_text_length:
-            article_text = article_text[:max_text_length] + "..."
-            full_prompt = f"{prompt}\n\nВАЖНО: Весь ответ должен быть на русском языке. Не используй английский язык.\n\nТекст статьи:\n{article_text}"
-        
         response = yandex_client.responses.create(
             prompt={
                 "id": YANDEX_CLOUD_ASSISTANT_ID,
@@ -390,42 +493,32 @@ def rewrite_article_with_yandex(article_text, style):
         raise ValueError(f"Ошибка подключения к YandexGPT API: {str(e)}")
 
 
-def rewrite_article_with_openrouter(article_text, style):
-    """Рерайтит статью через OpenRouter API"""
-    if not OPENROUTER_API_KEY:
-        raise ValueError("OpenRouter API не настроен. Добавьте OPENROUTER_API_KEY в .env")
-    
-    # Маппинг стилей для промпта
-    style_mapping = {
-        'scientific': 'НАУЧНО-ДЕЛОВОЙ',
-        'meme': 'МЕМНЫЙ',
-        'casual': 'ПОВСЕДНЕВНЫЙ'
-    }
-    
-    style_name = style_mapping.get(style, 'ПОВСЕДНЕВНЫЙ')
-    
-    # Ограничиваем длину текста
-    max_text_length = 12000
-    if len(article_text) > max_text_length:
-        article_text = article_text[:max_text_length] + "..."
-    
-    # Формируем промпт пользователя
-    full_prompt = f"Перепиши следующий текст в стиле {style_name}:\n\n{article_text}"
+def stream_article_with_yandex(article_text, style):
+    """Рерайтит статью через YandexGPT API, возвращая фрагменты текста по мере генерации"""
+    if not yandex_client:
+        raise ValueError("YandexGPT API не настроен. Добавьте YANDEX_CLOUD_API_KEY в .env")
     
     try:
-        headers = {
-            'Authorization': f'Bearer {OPENROUTER_API_KEY}',
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'https://phoenix-lab.com',  # Опционально, для отслеживания
-            'X-Title': 'Phoenix Lab'  # Опционально, для отслеживания
-        }
-        
-        payload = {
-            "model": OPENROUTER_MODEL,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": """Ты — инструмент для рерайта текстов. Твоя единственная задача — переписать предоставленный текст в указанном стиле БЕЗ МЫСЛЕЙ.
+        events = yandex_client.responses.create(
+            prompt={
+                "id": YANDEX_CLOUD_ASSISTANT_ID,
+            },
+            input=build_yandex_prompt(article_text, style),
+            stream=True,
+        )
+        try:
+            for event in events:
+                if event.type == 'response.output_text.delta':
+                    yield event.delta
+        finally:
+            # Закрываем соединение, если поток прерван (например, проиграл хеджированный запрос)
+            events.close()
+    except Exception as e:
+        logger.error(f"Ошибка потокового рерайта через YandexGPT: {e}")
+        raise ValueError(f"Ошибка подключения к YandexGPT API: {str(e)}")
+
+
+OPENROUTER_SYSTEM_PROMPT = """Ты — инструмент для рерайта текстов. Твоя единственная задача — переписать предоставленный текст в указанном стиле БЕЗ МЫСЛЕЙ.
 
 Доступные стили:
 - НАУЧНО-ДЕЛОВОЙ: формально, объективно, научная терминология
@@ -441,29 +534,83 @@ def rewrite_article_with_openrouter(article_text, style):
 6. Начинай сразу с переписанного текста
 7. Сохраняй смысл оригинала
 8. Длина примерно как у оригинала"""
-                },
-                {
-                    "role": "user",
-                    "content": full_prompt
-                }
-            ],
-            "temperature": 0.5,
-            "max_tokens": 4000,
-            "top_p": 0.95,
-            "stream": False,
-            # Стоп-последовательности для остановки генерации при начале мыслей
-            "stop": [
-                "\nДумаю:",
-                "\nВот переписанный текст:",
-                "\nThink:",
-                "\n("
-            ]
-        }
+
+
+def build_openrouter_request(article_text, style, stream=False):
+    """Формирует заголовки и тело запроса к OpenRouter"""
+    # Маппинг стилей для промпта
+    style_mapping = {
+        'scientific': 'НАУЧНО-ДЕЛОВОЙ',
+        'meme': 'МЕМНЫЙ',
+        'casual': 'ПОВСЕДНЕВНЫЙ'
+    }
+    
+    style_name = style_mapping.get(style, 'ПОВСЕДНЕВНЫЙ')
+    
+    # Ограничиваем длину текста (длинные статьи рерайтятся по частям, см. rewrite_article_text)
+    if len(article_text) > REWRITE_MAX_TEXT_LENGTH:
+        article_text = article_text[:REWRITE_MAX_TEXT_LENGTH] + "..."
+    
+    # Формируем промпт пользователя
+    full_prompt = f"Перепиши следующий текст в стиле {style_name}:\n\n{article_text}"
+    
+    headers = {
+        'Authorization': f'Bearer {OPENROUTER_API_KEY}',
+        'Content-Type': 'application/json',
+        'HTTP-Referer': 'https://phoenix-lab.com',  # Опционально, для отслеживания
+        'X-Title': 'Phoenix Lab'  # Опционально, для отслеживания
+    }
+    
+    payload = {
+        "model": OPENROUTER_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": OPENROUTER_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": full_prompt
+            }
+        ],
+        "temperature": 0.5,
+        "max_tokens": 4000,
+        "top_p": 0.95,
+        "stream": stream,
+        # Стоп-последовательности для остановки генерации при начале мыслей
+        "stop": [
+            "\nДумаю:",
+            "\nВот переписанный текст:",
+            "\nThink:",
+            "\n("
+        ]
+    }
+    return headers, payload
+
+
+def log_openrouter_error(e):
+    """Логирует ошибку HTTP запроса к OpenRouter вместе с ответом сервера"""
+    logger.error(f"Ошибка HTTP запроса к OpenRouter: {e}")
+    if hasattr(e, 'response') and e.response is not None:
+        try:
+            error_detail = e.response.json()
+            logger.error(f"Ответ сервера: {error_detail}")
+        except:
+            logger.error(f"Ответ сервера: {e.response.text}")
+
+
+def rewrite_article_with_openrouter(article_text, style):
+    """Рерайтит статью через OpenRouter API"""
+    if not OPENROUTER_API_KEY:
+        raise ValueError("OpenRouter API не настроен. Добавьте OPENROUTER_API_KEY в .env")
+    
+    try:
+        headers, payload = build_openrouter_request(article_text, style)
         
         logger.info(f"Отправка запроса в OpenRouter для стиля: {style}")
         logger.info(f"OpenRouter URL: {OPENROUTER_API_URL}")
         logger.info(f"OpenRouter Model: {OPENROUTER_MODEL}")
-        response = requests.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=60)
+        response = openrouter_http.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=60)
         response.raise_for_status()
         
         result = response.json()
@@ -481,19 +628,179 @@ def rewrite_article_with_openrouter(article_text, style):
             raise ValueError("Неожиданный формат ответа от OpenRouter API")
             
     except requests.exceptions.RequestException as e:
-        logger.error(f"Ошибка HTTP запроса к OpenRouter: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            try:
-                error_detail = e.response.json()
-                logger.error(f"Ответ сервера: {error_detail}")
-            except:
-                logger.error(f"Ответ сервера: {e.response.text}")
+        log_openrouter_error(e)
         raise ValueError(f"Ошибка подключения к OpenRouter API: {str(e)}")
     except Exception as e:
         logger.error(f"Ошибка рерайта через OpenRouter: {e}")
         raise
 
 
+def stream_article_with_openrouter(article_text, style):
+    """Рерайтит статью через OpenRouter API (SSE), возвращая фрагменты текста по мере генерации"""
+    if not OPENROUTER_API_KEY:
+        raise ValueError("OpenRouter API не настроен. Добавьте OPENROUTER_API_KEY в .env")
+    
+    headers, payload = build_openrouter_request(article_text, style, stream=True)
+    logger.info(f"Потоковый запрос в OpenRouter для стиля: {style}")
+    try:
+        with openrouter_http.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=60, stream=True) as response:
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                # Пропускаем пустые строки и комментарии keep-alive
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if 'error' in chunk:
+                    raise ValueError(f"Ошибка OpenRouter API: {chunk['error']}")
+                choices = chunk.get('choices') or []
+                delta = choices[0].get('delta', {}).get('content') if choices else None
+                if delta:
+                    yield delta
+    except requests.exceptions.RequestException as e:
+        log_openrouter_error(e)
+        raise ValueError(f"Ошибка подключения к OpenRouter API: {str(e)}")
+
+
+# Провайдеры рерайта с предохранителями: после PROVIDER_BREAKER_FAILURES ошибок подряд
+# провайдер отключается на PROVIDER_BREAKER_RESET секунд.
+# auto: запрос уходит REWRITE_AUTO_PRIMARY, а если тот не ответил за перцентиль HEDGE_PERCENTILE
+# своих последних задержек (пока замеров мало — за HEDGE_DEFAULT_DELAY секунд) или упал,
+# дублируется второму провайдеру; берётся первый ответ
+PROVIDER_BREAKER_FAILURES = int(os.getenv('PROVIDER_BREAKER_FAILURES', 3))
+PROVIDER_BREAKER_RESET = float(os.getenv('PROVIDER_BREAKER_RESET', 30))
+REWRITE_AUTO_PRIMARY = os.getenv('REWRITE_AUTO_PRIMARY', 'qwen')
+
+rewrite_providers = {
+    'qwen': RewriteProvider(
+        'qwen', rewrite_article_with_openrouter, stream_article_with_openrouter,
+        configured=bool(OPENROUTER_API_KEY),
+        breaker=CircuitBreaker(PROVIDER_BREAKER_FAILURES, PROVIDER_BREAKER_RESET)
+    ),
+    'yandex': RewriteProvider(
+        'yandex', rewrite_article_with_yandex, stream_article_with_yandex,
+        configured=yandex_client is not None,
+        breaker=CircuitBreaker(PROVIDER_BREAKER_FAILURES, PROVIDER_BREAKER_RESET)
+    )
+}
+rewrite_providers['auto'] = HedgedProvider(
+    sorted(rewrite_providers.values(), key=lambda provider: provider.name != REWRITE_AUTO_PRIMARY),
+    percentile=float(os.getenv('HEDGE_PERCENTILE', 0.95)),
+    default_delay=float(os.getenv('HEDGE_DEFAULT_DELAY', 10)),
+    min_delay=float(os.getenv('HEDGE_MIN_DELAY', 0.5))
+)
+
+
+def use_chunked_rewrite(article_text, chunked=None):
+    """Нужен ли рерайт по частям: флаг запроса, иначе REWRITE_CHUNKED"""
+    if chunked is None:
+        if REWRITE_CHUNKED == 'always':
+            return True
+        if REWRITE_CHUNKED == 'never':
+            return False
+        return len(article_text) > REWRITE_MAX_TEXT_LENGTH
+    return bool(chunked)
+
+
+def split_article(article_text):
+    chunks = split_into_chunks(article_text, REWRITE_CHUNK_TOKENS)
+    logger.info(
+        f"Рерайт по частям: {len(chunks)} шт., до ~{max(estimate_tokens(chunk) for chunk in chunks)} токенов"
+    )
+    return chunks
+
+
+def rewrite_article_text(article_text, style, provider, chunked=False):
+    """Рерайтит текст целиком или по частям (параллельно, с сохранением порядка)"""
+    rewrite = rewrite_providers[provider].rewrite
+    if not chunked:
+        return rewrite(article_text, style)
+    return rewrite_chunks(split_article(article_text), lambda chunk: rewrite(chunk, style), rewrite_executor)
+
+
+def check_rewrite_request(data):
+    """Проверяет URL, стиль и провайдер запроса рерайта, возвращает текст ошибки или None"""
+    article_url = data.get('url', '')
+    style = data.get('style', 'casual')
+    provider = data.get('provider', 'qwen')  # 'qwen', 'yandex' или 'auto'
+    
+    if not article_url:
+        logger.error("URL статьи не указан в запросе")
+        return 'URL статьи не указан'
+    
+    if style not in ['scientific', 'meme', 'casual']:
+        logger.error(f"Неверный стиль рерайта: {style}")
+        return 'Неверный стиль рерайта'
+    
+    if provider not in rewrite_providers:
+        logger.error(f"Неверный провайдер: {provider}")
+        return 'Неверный провайдер. Используйте "qwen", "yandex" или "auto"'
+    
+    if provider == 'qwen' and not OPENROUTER_API_KEY:
+        return 'OpenRouter API не настроен. Добавьте OPENROUTER_API_KEY в .env'
+    if provider == 'yandex' and not yandex_client:
+        return 'YandexGPT API не настроен. Добавьте YANDEX_CLOUD_API_KEY в .env'
+    if provider == 'auto' and not rewrite_providers['auto'].configured:
+        return 'Ни один провайдер рерайта не настроен'
+    return None
+
+
+def build_rewrite_params(data, article_text):
+    """Проверяет извлечённый текст и собирает параметры рерайта: (параметры, None) или (None, текст ошибки)"""
+    if not article_text:
+        logger.error("Извлечённый текст пуст")
+        return None, 'Не удалось извлечь текст статьи'
+    
+    if len(article_text) < 50:
+        logger.warning(f"Текст слишком короткий: {len(article_text)} символов")
+        return None, f'Текст статьи слишком короткий ({len(article_text)} символов). Минимум 50 символов.'
+    
+    style = data.get('style', 'casual')
+    provider = data.get('provider', 'qwen')
+    models = {'qwen': OPENROUTER_MODEL, 'yandex': YANDEX_CLOUD_ASSISTANT_ID}
+    model = models.get(provider, f"{OPENROUTER_MODEL}|{YANDEX_CLOUD_ASSISTANT_ID}")
+    chunked = use_chunked_rewrite(article_text, data.get('chunked'))
+    return {
+        'url': data.get('url', ''),
+        'style': style,
+        'provider': provider,
+        'article_text': article_text,
+        'chunked': chunked,
+        'cache_key': rewrite_cache_key(
+            article_text, style, provider, model, REWRITE_PROMPT_VERSION, 'chunked' if chunked else 'single'
+        ),
+        'fresh': bool(data.get('fresh'))
+    }, None
+
+
+def prepare_rewrite(data):
+    """Проверяет параметры рерайта и извлекает текст статьи.
+
+    Возвращает (параметры рерайта, None) или (None, JSON ответ об ошибке).
+    """
+    error = check_rewrite_request(data)
+    if error:
+        return None, (jsonify({'success': False, 'error': error}), 400)
+    
+    # Извлекаем текст статьи
+    article_url = data['url']
+    logger.info(f"Извлечение текста из URL: {article_url}")
+    try:
+        article_text = extract_article_text(article_url)
+        logger.info(f"Текст извлечён, длина: {len(article_text)} символов")
+    except Exception as e:
+        logger.error(f"Ошибка извлечения текста из {article_url}: {e}")
+        return None, (jsonify({'success': False, 'error': f'Не удалось извлечь текст статьи: {str(e)}'}), 400)
+    
+    params, error = build_rewrite_params(data, article_text)
+    if error:
+        return None, (jsonify({'success': False, 'error': error}), 400)
+    return params, None
+
+
 @app.route('/api/rewrite-article', methods=['POST'])
 def rewrite_article():
     """Рерайтит статью через выбранный провайдер (Qwen или YandexGPT)"""
@@ -501,61 +808,46 @@ def rewrite_article():
         if not request.json:
             return jsonify({'success': False, 'error': 'Отсутствует тело запроса'}), 400
         
-        data = request.json
-        article_url = data.get('url', '')
-        style = data.get('style', 'casual')
-        provider = data.get('provider', 'qwen')  # 'qwen' или 'yandex'
-        
-        if not article_url:
-            logger.error("URL статьи не указан в запросе")
-            return jsonify({'success': False, 'error': 'URL статьи не указан'}), 400
+        params, error_response = prepare_rewrite(request.json)
+        if error_response:
+            return error_response
         
-        if style not in ['scientific', 'meme', 'casual']:
-            logger.error(f"Неверный стиль рерайта: {style}")
-            return jsonify({'success': False, 'error': 'Неверный стиль рерайта'}), 400
+        article_text = params['article_text']
+        style = params['style']
+        provider = params['provider']
         
-        if provider not in ['qwen', 'yandex']:
-            logger.error(f"Неверный провайдер: {provider}")
-            return jsonify({'success': False, 'error': 'Неверный провайдер. Используйте "qwen" или "yandex"'}), 400
-        
-        # Извлекаем текст статьи
-        logger.info(f"Извлечение текста из URL: {article_url}")
-        try:
-            article_text = extract_article_text(article_url)
-            logger.info(f"Текст извлечён, длина: {len(article_text)} символов")
-        except Exception as e:
-            logger.error(f"Ошибка извлечения текста из {article_url}: {e}")
-            return jsonify({'success': False, 'error': f'Не удалось извлечь текст статьи: {str(e)}'}), 400
-        
-        if not article_text:
-            logger.error("Извлечённый текст пуст")
-            return jsonify({'success': False, 'error': 'Не удалось извлечь текст статьи'}), 400
-        
-        if len(article_text) < 50:
-            logger.warning(f"Текст слишком короткий: {len(article_text)} символов")
-            return jsonify({'success': False, 'error': f'Текст статьи слишком короткий ({len(article_text)} символов). Минимум 50 символов.'}), 400
+        # Повторный рерайт того же текста берём из кэша, если не запрошен свежий результат
+        if not params['fresh']:
+            cached_text = rewrite_cache.get(params['cache_key'])
+            if cached_text is not None:
+                logger.info(f"Результат рерайта взят из кэша ({provider}, {style})")
+                return jsonify({
+                    'success': True,
+                    'text': cached_text,
+                    'provider': provider,
+                    'cached': True
+                }), 200
         
         # Рерайтим через выбранный провайдер
         logger.info(f"Рерайт статьи через {provider} в стиле: {style}, длина текста: {len(article_text)}")
         try:
-            if provider == 'qwen':
-                if not OPENROUTER_API_KEY:
-                    return jsonify({'success': False, 'error': 'OpenRouter API не настроен. Добавьте OPENROUTER_API_KEY в .env'}), 400
-                rewritten_text = rewrite_article_with_openrouter(article_text, style)
-            elif provider == 'yandex':
-                if not yandex_client:
-                    return jsonify({'success': False, 'error': 'YandexGPT API не настроен. Добавьте YANDEX_CLOUD_API_KEY в .env'}), 400
-                rewritten_text = rewrite_article_with_yandex(article_text, style)
+            rewritten_text = rewrite_article_text(article_text, style, provider, params['chunked'])
             
             logger.info(f"Рерайт завершён, длина результата: {len(rewritten_text)} символов")
+        except ProviderUnavailable as e:
+            logger.error(f"Провайдер {provider} недоступен: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 503
         except Exception as e:
             logger.error(f"Ошибка рерайта через {provider}: {e}")
             return jsonify({'success': False, 'error': f'Ошибка рерайта: {str(e)}'}), 500
         
+        rewrite_cache.put(params['cache_key'], rewritten_text)
+        
         return jsonify({
             'success': True,
             'text': rewritten_text,
-            'provider': provider
+            'provider': provider,
+            'cached': False
         }), 200
         
     except ValueError as e:
@@ -566,88 +858,333 @@ def rewrite_article():
         return jsonify({'success': False, 'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
 
 
-@app.route('/api/send-article', methods=['POST'])
-def send_article():
-    """Отправляет статью в каналы через Telegram Bot API"""
-    try:
-        data = request.json
-        article_text = data.get('article_text', '')
-        selected_channels = data.get('channels', [])  # Список ID каналов для отправки
-        
-        if not article_text.strip():
-            return jsonify({'success': False, 'error': 'Текст статьи не может быть пустым'}), 400
-        
-        # Загружаем каналы
-        all_channels = load_channels()
-        
-        # Если указаны конкретные каналы, используем их, иначе все
-        if selected_channels:
-            channels_to_send = [ch for ch in all_channels if ch['id'] in selected_channels]
-        else:
-            channels_to_send = all_channels
+def sse_event(event, payload):
+    """Форматирует событие Server-Sent Events с JSON данными"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/rewrite-article/stream', methods=['POST'])
+def rewrite_article_stream():
+    """Рерайтит статью, передавая текст клиенту по мере генерации (SSE).
+
+    События: chunk {"text"} — очередной фрагмент, done {"text", "provider", "cached"} —
+    окончательный очищенный текст, error {"error"} — ошибка во время генерации.
+    """
+    if not request.json:
+        return jsonify({'success': False, 'error': 'Отсутствует тело запроса'}), 400
+    
+    params, error_response = prepare_rewrite(request.json)
+    if error_response:
+        return error_response
+    
+    article_text = params['article_text']
+    style = params['style']
+    provider = params['provider']
+    
+    def events():
+        if not params['fresh']:
+            cached_text = rewrite_cache.get(params['cache_key'])
+            if cached_text is not None:
+                logger.info(f"Результат рерайта взят из кэша ({provider}, {style})")
+                yield sse_event('chunk', {'text': cached_text})
+                yield sse_event('done', {'text': cached_text, 'provider': provider, 'cached': True})
+                return
         
-        if not channels_to_send:
-            return jsonify({'success': False, 'error': 'Каналы не настроены'}), 400
+        logger.info(f"Потоковый рерайт статьи через {provider} в стиле: {style}, длина текста: {len(article_text)}")
+        rewrite, stream = rewrite_providers[provider].rewrite, rewrite_providers[provider].stream
         
-        success_count = 0
-        failed_channels = []
+        # По частям: первый кусок идёт потоком, остальные параллельно рерайтятся
+        # в фоне и отдаются целиком по порядку, когда до них дойдёт очередь
+        chunks = split_article(article_text) if params['chunked'] else [article_text]
+        futures = [rewrite_executor.submit(rewrite, chunk, style) for chunk in chunks[1:]]
+        cleaner = StreamingResponseCleaner()
+        raw_parts = []
+        try:
+            for delta in stream(chunks[0], style):
+                raw_parts.append(delta)
+                text = cleaner.feed(delta)
+                if text:
+                    yield sse_event('chunk', {'text': text})
+            text = cleaner.finish()
+            if text:
+                yield sse_event('chunk', {'text': text})
+            
+            rewritten_parts = [clean_model_response(''.join(raw_parts))]
+            for future in futures:
+                rewritten_parts.append(future.result())
+                yield sse_event('chunk', {'text': CHUNK_SEPARATOR + rewritten_parts[-1]})
+        except Exception as e:
+            logger.error(f"Ошибка потокового рерайта через {provider}: {e}")
+            yield sse_event('error', {'error': f'Ошибка рерайта: {str(e)}'})
+            return
+        finally:
+            for future in futures:
+                future.cancel()
         
-        # Асинхронная функция для отправки сообщений
-        async def send_messages():
-            nonlocal success_count, failed_channels
-            # Создаём новый экземпляр Bot для этого запроса
-            current_bot = Bot(token=BOT_TOKEN)
+        rewritten_text = CHUNK_SEPARATOR.join(rewritten_parts)
+        logger.info(f"Потоковый рерайт завершён, длина результата: {len(rewritten_text)} символов")
+        rewrite_cache.put(params['cache_key'], rewritten_text)
+        yield sse_event('done', {'text': rewritten_text, 'provider': provider, 'cached': False})
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# Пакетный рерайт (POST /api/rewrite-batch): каждая статья загружается один раз для всех
+# стилей, а одновременных рерайтов у каждого провайдера не больше REWRITE_BATCH_PROVIDER_CONCURRENCY.
+# Лимит считается по провайдеру из запроса: у auto свой пул слотов, и его запросы (вместе с
+# дублированными) идут в qwen/yandex сверх их слотов, так что на каждый из них из пакета может
+# приходиться до 2 * REWRITE_BATCH_PROVIDER_CONCURRENCY одновременных запросов
+REWRITE_BATCH_MAX_ITEMS = int(os.getenv('REWRITE_BATCH_MAX_ITEMS', 50))
+REWRITE_BATCH_PROVIDER_CONCURRENCY = int(os.getenv('REWRITE_BATCH_PROVIDER_CONCURRENCY', 4))
+batch_fetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('REWRITE_BATCH_FETCH_WORKERS', 8)),
+    thread_name_prefix='batch-fetch'
+)
+batch_rewrite_executor = ThreadPoolExecutor(
+    max_workers=REWRITE_BATCH_PROVIDER_CONCURRENCY * len(rewrite_providers),
+    thread_name_prefix='batch-rewrite'
+)
+batch_provider_slots = {
+    name: threading.BoundedSemaphore(REWRITE_BATCH_PROVIDER_CONCURRENCY) for name in rewrite_providers
+}
+
+
+def rewrite_batch_item(index, item, article_text, cancelled):
+    """Рерайт одного элемента пакета, возвращает строку результата"""
+    result = {'index': index, 'url': item.get('url'), 'style': item.get('style', 'casual'),
+              'provider': item.get('provider', 'qwen')}
+    if cancelled.is_set():
+        return {**result, 'success': False, 'error': 'Отменено'}
+    
+    params, error = build_rewrite_params(item, article_text)
+    if error:
+        return {**result, 'success': False, 'error': error}
+    
+    if not params['fresh']:
+        cached_text = rewrite_cache.get(params['cache_key'])
+        if cached_text is not None:
+            return {**result, 'success': True, 'text': cached_text, 'cached': True}
+    
+    with batch_provider_slots[params['provider']]:
+        if cancelled.is_set():
+            return {**result, 'success': False, 'error': 'Отменено'}
+        try:
+            rewritten_text = rewrite_article_text(article_text, params['style'], params['provider'], params['chunked'])
+        except Exception as e:
+            logger.error(f"Ошибка рерайта {params['url']} через {params['provider']}: {e}")
+            return {**result, 'success': False, 'error': f'Ошибка рерайта: {str(e)}'}
+    
+    rewrite_cache.put(params['cache_key'], rewritten_text)
+    return {**result, 'success': True, 'text': rewritten_text, 'cached': False}
+
+
+@app.route('/api/rewrite-batch', methods=['POST'])
+def rewrite_batch():
+    """Пакетный рерайт списка {url, style, provider}: результаты идут NDJSON строками по мере готовности.
+
+    Каждая строка — результат элемента с его index; последняя строка —
+    итог {"done": true, "total", "succeeded", "failed"}.
+    """
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Список items не указан'}), 400
+    if len(items) > REWRITE_BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'Не больше {REWRITE_BATCH_MAX_ITEMS} элементов за запрос'}), 400
+    
+    results = queue.Queue()
+    cancelled = threading.Event()
+    by_url = {}  # нормализованный URL -> индексы элементов
+    for index, item in enumerate(items):
+        error = check_rewrite_request(item) if isinstance(item, dict) else 'Элемент должен быть объектом'
+        if error:
+            results.put({'index': index, 'url': item.get('url') if isinstance(item, dict) else None,
+                         'success': False, 'error': error})
+            continue
+        by_url.setdefault(normalize_url(item['url']), []).append(index)
+    
+    def on_fetched(indexes, future):
+        # Текст статьи загружен один раз — рерайты всех стилей этой статьи ставим в очередь
+        try:
+            article_text = future.result()
+        except Exception as e:
+            for index in indexes:
+                results.put({'index': index, 'url': items[index]['url'], 'success': False,
+                             'error': f'Не удалось извлечь текст статьи: {str(e)}'})
+            return
+        # Одинаковые элементы (стиль, провайдер, режим) рерайтятся один раз
+        groups = {}
+        for index in indexes:
+            item = items[index]
+            key = (item.get('style', 'casual'), item.get('provider', 'qwen'), item.get('chunked'), bool(item.get('fresh')))
+            groups.setdefault(key, []).append(index)
+        for same in groups.values():
             try:
-                for channel in channels_to_send:
-                    try:
-                        await current_bot.send_message(
-                            chat_id=channel['id'],
-                            text=article_text,
-                            parse_mode='HTML'
-                        )
-                        success_count += 1
-                        logger.info(f"Статья отправлена в канал: {channel['name']} ({channel['id']})")
-                    except TelegramAPIError as e:
-                        error_msg = str(e)
-                        failed_channels.append({
-                            'channel': channel['name'],
-                            'error': error_msg
-                        })
-                        logger.error(f"Ошибка отправки в канал {channel['name']}: {error_msg}")
-                    except Exception as e:
-                        failed_channels.append({
-                            'channel': channel.get('name', channel['id']),
-                            'error': str(e)
-                        })
-                        logger.error(f"Ошибка отправки в канал {channel['id']}: {e}")
-            finally:
-                # Закрываем сессию бота после отправки
-                await current_bot.session.close()
-        
-        # Запускаем асинхронную функцию
-        # Всегда создаём новый event loop для каждого запроса
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+                future = batch_rewrite_executor.submit(rewrite_batch_item, same[0], items[same[0]], article_text, cancelled)
+            except RuntimeError as e:
+                # Пул остановлен (завершение процесса) — иначе поток ответа ждал бы эти элементы вечно
+                logger.error(f"Не удалось запустить рерайт элемента {same[0]} пакета: {e}")
+                for index in same:
+                    results.put({'index': index, 'url': items[index]['url'], 'style': items[index].get('style', 'casual'),
+                                 'provider': items[index].get('provider', 'qwen'), 'success': False,
+                                 'error': f'Не удалось запустить рерайт: {str(e)}'})
+                continue
+            future.add_done_callback(lambda done, same=same: on_rewritten(same, done))
+    
+    def on_rewritten(indexes, future):
         try:
-            loop.run_until_complete(send_messages())
+            result = future.result()
         except Exception as e:
-            logger.error(f"Ошибка работы с event loop: {e}")
-            raise
+            logger.error(f"Ошибка элемента {indexes[0]} пакетного рерайта: {e}")
+            result = {'success': False, 'error': str(e)}
+        for index in indexes:
+            results.put({**result, 'index': index, 'url': items[index]['url']})
+    
+    logger.info(f"Пакетный рерайт: {len(items)} элементов, {len(by_url)} уникальных статей")
+    for indexes in by_url.values():
+        future = batch_fetch_executor.submit(extract_article_text, items[indexes[0]]['url'])
+        future.add_done_callback(lambda done, indexes=indexes: on_fetched(indexes, done))
+    
+    def lines():
+        succeeded = 0
+        try:
+            for _ in range(len(items)):
+                result = results.get()
+                succeeded += result['success']
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+            yield json.dumps({'done': True, 'total': len(items), 'succeeded': succeeded,
+                              'failed': len(items) - succeeded}) + '\n'
         finally:
-            # Закрываем loop после использования
+            # Клиент отключился — ещё не начатые рерайты не выполняем
+            cancelled.set()
+    
+    return Response(
+        stream_with_context(lines()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def broadcast_article(channels_to_send, article_text, on_result=None, job_id=None):
+    """Корутина рассылки статьи общим Bot (выполняется в фоновом event loop bot_runtime)"""
+    if not send_history:
+        return send_to_channels(
+            bot_runtime.bot,
+            channels_to_send,
+            article_text,
+            telegram_rate_limiter,
+            concurrency=TELEGRAM_SEND_CONCURRENCY,
+            max_retries=TELEGRAM_SEND_MAX_RETRIES,
+            on_result=on_result
+        )
+    return broadcast_with_history(channels_to_send, article_text, on_result, job_id)
+
+
+async def broadcast_with_history(channels_to_send, article_text, on_result, job_id):
+    """Рассылка с записью результатов в историю одной транзакцией после завершения"""
+    results = []
+    
+    def record(channel, failure):
+        results.append((channel, failure))
+        if on_result:
+            on_result(channel, failure)
+    
+    try:
+        return await send_to_channels(
+            bot_runtime.bot,
+            channels_to_send,
+            article_text,
+            telegram_rate_limiter,
+            concurrency=TELEGRAM_SEND_CONCURRENCY,
+            max_retries=TELEGRAM_SEND_MAX_RETRIES,
+            on_result=record
+        )
+    finally:
+        if results:
             try:
-                # Отменяем все незавершённые задачи
-                pending = [t for t in asyncio.all_tasks(loop) if not t.done()]
-                for task in pending:
-                    task.cancel()
-                # Ждём отмены задач
-                if pending:
-                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
-            except Exception:
-                pass
-            finally:
-                if not loop.is_closed():
-                    loop.close()
+                send_history.record_many(results, job_id)
+            except Exception as e:
+                logger.error(f"Ошибка записи истории отправок: {e}")
+
+
+def deliver_article(channels_to_send, article_text, on_result=None, job_id=None):
+    """Отправляет статью в каналы через общий Bot в фоновом event loop"""
+    return bot_runtime.run(broadcast_article(channels_to_send, article_text, on_result, job_id))
+
+
+def run_broadcast_job(job, channels_to_send, article_text):
+    """Выполняет задачу рассылки в пуле воркеров"""
+    job.start()
+    try:
+        deliver_article(channels_to_send, article_text, on_result=job.record, job_id=job.id)
+        job.finish()
+    except Exception as e:
+        logger.error(f"Ошибка задачи рассылки {job.id}: {e}")
+        job.finish(error=str(e))
+
+
+def select_channels(data):
+    """Каналы для рассылки из запроса: (каналы, None) или (None, текст ошибки)"""
+    article_text = data.get('article_text', '')
+    selected_channels = data.get('channels', [])  # Список ID каналов для отправки
+    
+    if not article_text.strip():
+        return None, 'Текст статьи не может быть пустым'
+    
+    # Если указаны конкретные каналы, используем их, иначе все
+    if selected_channels:
+        channels_to_send = [channel_registry.get(channel_id) for channel_id in dict.fromkeys(map(str, selected_channels))]
+        channels_to_send = [ch for ch in channels_to_send if ch]
+    else:
+        channels_to_send = channel_registry.all()
+    
+    if not channels_to_send:
+        return None, 'Каналы не настроены'
+    
+    # При рассылке во все каналы пропускаем помеченные проверкой как недоступные; явно
+    # выбранные каналы отправляются всегда, чтобы ошибка попала в failed, а не потерялась
+    if not selected_channels:
+        dead_channels = [ch for ch in channels_to_send if ch.get('status') == 'dead']
+        if dead_channels:
+            logger.warning(f"Пропущены недоступные каналы: {', '.join(ch['name'] for ch in dead_channels)}")
+            channels_to_send = [ch for ch in channels_to_send if ch.get('status') != 'dead']
+            if not channels_to_send:
+                return None, 'Все каналы недоступны, проверьте их через /api/channels/validate'
+    return channels_to_send, None
+
+
+def start_broadcast_job(channels_to_send, article_text):
+    """Ставит рассылку в фоновую очередь и возвращает описание задачи"""
+    job = broadcast_jobs.create(channels_to_send)
+    broadcast_executor.submit(run_broadcast_job, job, channels_to_send, article_text)
+    logger.info(f"Создана задача рассылки {job.id} на {len(channels_to_send)} каналов")
+    return {
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'total': len(channels_to_send)
+    }
+
+
+@app.route('/api/send-article', methods=['POST'])
+def send_article():
+    """Отправляет статью в каналы через Telegram Bot API"""
+    try:
+        data = request.json
+        article_text = data.get('article_text', '')
+        channels_to_send, error = select_channels(data)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        # В асинхронном режиме сразу возвращаем id задачи, рассылка идёт в фоне
+        if data.get('async'):
+            return jsonify(start_broadcast_job(channels_to_send, article_text)), 202
+        
+        success_count, failed_channels = deliver_article(channels_to_send, article_text)
         
         return jsonify({
             'success': True,
@@ -661,11 +1198,20 @@ def send_article():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/send-article/<job_id>', methods=['GET'])
+def send_article_status(job_id):
+    """Возвращает прогресс задачи рассылки по каналам"""
+    job = broadcast_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    return jsonify({'success': True, **job.to_dict()}), 200
+
+
 @app.route('/api/channels', methods=['GET'])
 def get_channels():
     """Возвращает список доступных каналов"""
     try:
-        channels = load_channels()
+        channels = channel_registry.all()
         return jsonify({
             'success': True,
             'channels': channels
@@ -675,6 +1221,60 @@ def get_channels():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/channels/validate', methods=['POST'])
+def validate_channels_route():
+    """Проверяет все каналы (доступность и права бота) и помечает недоступные"""
+    try:
+        channels = channel_registry.all()
+        if not channels:
+            return jsonify({'success': False, 'error': 'Каналы не настроены'}), 400
+        
+        results = bot_runtime.run(validate_channels(
+            bot_runtime.bot,
+            channels,
+            chat_info_cache,
+            concurrency=CHANNEL_VALIDATION_CONCURRENCY
+        ))
+        dead = mark_channels(channel_registry, results)
+        return jsonify({
+            'success': True,
+            'checked': len(results),
+            'dead': dead,
+            'channels': results
+        }), 200
+    except Exception as e:
+        logger.error(f"Ошибка проверки каналов: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/send-history', methods=['GET'])
+def get_send_history():
+    """Последние отправки в каналы (только с STORAGE_BACKEND=sqlite)"""
+    if not send_history:
+        return jsonify({'success': False, 'error': 'История отправок доступна только с STORAGE_BACKEND=sqlite'}), 404
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit должен быть числом'}), 400
+    return jsonify({
+        'success': True,
+        'results': send_history.recent(request.args.get('channel'), limit)
+    }), 200
+
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """Счётчики кэшей, правил извлечения и провайдеров рерайта"""
+    return jsonify({
+        'success': True,
+        'article_cache': article_cache.stats(),
+        'rewrite_cache': rewrite_cache.stats(),
+        'extraction': extraction_rules.stats(),
+        'providers': {name: provider.stats() for name, provider in rewrite_providers.items()},
+        'chat_info': chat_info_cache.stats()
+    }), 200
+
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """Проверка работоспособности сервера"""
@@ -692,7 +1292,7 @@ def generate_token():
         return jsonify({
             'success': True,
             'token': token,
-            'expires_in': 300  # секунд
+            'expires_in': AUTH_TOKEN_TTL  # секунд
         }), 200
     except Exception as e:
         logger.error(f"Ошибка генерации токена: {e}")
@@ -732,6 +1332,48 @@ def verify_token():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/auth/wait/<token>', methods=['GET'])
+def wait_token(token):
+    """Ждёт авторизации токена: SSE поток или long-poll вместо опроса verify-token"""
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        def events():
+            while True:
+                token_data = token_store.wait(token, AUTH_WAIT_HEARTBEAT)
+                if token_data is None:
+                    yield "event: expired\ndata: {}\n\n"
+                    return
+                if token_data['status'] == 'authorized':
+                    payload = json.dumps({'user': token_data.get('user_data')}, ensure_ascii=False)
+                    yield f"event: authorized\ndata: {payload}\n\n"
+                    return
+                yield ": ping\n\n"
+        
+        return Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    try:
+        timeout = min(float(request.args.get('timeout', AUTH_WAIT_TIMEOUT)), AUTH_WAIT_TIMEOUT)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Неверный timeout'}), 400
+    
+    token_data = token_store.wait(token, max(timeout, 0))
+    if token_data and token_data['status'] == 'authorized':
+        return jsonify({
+            'success': True,
+            'authorized': True,
+            'user': token_data.get('user_data')
+        }), 200
+    return jsonify({
+        'success': True,
+        'authorized': False,
+        'expired': token_data is None,
+        'message': 'Токен не найден или не авторизован'
+    }), 200
+
+
 @app.route('/api/auth/authorize', methods=['POST', 'OPTIONS'])
 def authorize():
     """Авторизует токен с данными пользователя (вызывается ботом)"""
@@ -759,4 +1401,10 @@ def authorize():
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    if SERVER_MODE == 'asgi':
+        # asgi.py импортирует server: регистрируем уже загруженный модуль, чтобы не инициализировать его повторно
+        sys.modules['server'] = sys.modules[__name__]
+        from asgi import run
+        run(port)
+    else:
+        app.run(host='0.0.0.0', port=port, debug=True)
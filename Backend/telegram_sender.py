@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import threading
+import time
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket с резервированием: reserve() сразу списывает токен и
+    возвращает, сколько секунд нужно подождать до отправки.
+
+    Состояние защищено threading.Lock, поэтому один bucket можно делить
+    между запросами и event loop'ами.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # токенов в секунду
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def is_full(self, now):
+        """Восстановился ли bucket полностью к моменту now — тогда он неотличим от нового"""
+        with self._lock:
+            return self._tokens + (now - self._updated_at) * self.rate >= self.capacity
+
+
+class TelegramRateLimiter:
+    """Ограничивает отправку глобально и для каждого чата отдельно.
+
+    Bucket'ы чатов, которые полностью восстановились, раз в sweep_interval
+    секунд удаляются: для такого чата новый bucket ведёт себя так же, а
+    словарь не растёт с числом когда-либо использованных чатов.
+    """
+
+    def __init__(self, global_rate=30, per_chat_per_minute=20, sweep_interval=60):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_per_minute / 60
+        self.sweep_interval = sweep_interval
+        self._chat_buckets = {}
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _sweep(self, now):
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_full(now)]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+        self._swept_at = now
+
+    def _reserve_chat(self, chat_id):
+        # Резервируем под общей блокировкой, чтобы bucket не удалили между поиском и списанием токена
+        with self._lock:
+            now = time.monotonic()
+            if now - self._swept_at >= self.sweep_interval:
+                self._sweep(now)
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.per_chat_rate, 1)
+                self._chat_buckets[chat_id] = bucket
+            return bucket.reserve()
+
+    async def acquire(self, chat_id):
+        """Ждёт, пока отправка в чат не нарушит лимиты"""
+        delay = max(self.global_bucket.reserve(), self._reserve_chat(chat_id))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def send_to_channels(bot, channels, text, limiter, concurrency=10, max_retries=3, on_result=None):
+    """Отправляет текст во все каналы параллельно (не больше concurrency одновременно).
+
+    Возвращает (количество успешных отправок, список ошибок по каналам) —
+    в том же формате, что и ответ /api/send-article. Если передан on_result,
+    он вызывается как on_result(channel, failure) сразу после обработки
+    каждого канала (failure равен None при успехе).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one(channel):
+        failure = await deliver(channel)
+        if on_result:
+            on_result(channel, failure)
+        return failure
+
+    async def deliver(channel):
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                await limiter.acquire(channel['id'])
+                try:
+                    await bot.send_message(
+                        chat_id=channel['id'],
+                        text=text,
+                        parse_mode='HTML'
+                    )
+                    logger.info(f"Статья отправлена в канал: {channel['name']} ({channel['id']})")
+                    return None
+                except TelegramRetryAfter as e:
+                    if attempt == max_retries:
+                        logger.error(f"Ошибка отправки в канал {channel['name']}: {e}")
+                        return {'channel': channel['name'], 'error': str(e)}
+                    logger.warning(f"Flood control в канале {channel['name']}, повтор через {e.retry_after} с")
+                    await asyncio.sleep(e.retry_after)
+                except TelegramAPIError as e:
+                    error_msg = str(e)
+                    logger.error(f"Ошибка отправки в канал {channel['name']}: {error_msg}")
+                    return {'channel': channel['name'], 'error': error_msg}
+                except Exception as e:
+                    logger.error(f"Ошибка отправки в канал {channel['id']}: {e}")
+                    return {'channel': channel.get('name', channel['id']), 'error': str(e)}
+
+    results = await asyncio.gather(*(send_one(channel) for channel in channels))
+    failed_channels = [result for result in results if result is not None]
+    return len(channels) - len(failed_channels), failed_channels
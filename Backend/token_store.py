@@ -0,0 +1,356 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotPersistence:
+    """Сохраняет токены целиком в JSON файл (снимок)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Читает снимок токенов с диска"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.warning("Файл токенов поврежден, создаю новый")
+            return {}
+
+    def record(self, op, token, token_data):
+        """Снимок пишется целиком при сбросе, отдельные изменения не сохраняются"""
+
+    def prepare_flush(self, tokens):
+        """Вызывается под блокировкой хранилища: копирует токены для записи"""
+        return {k: dict(v) for k, v in tokens.items()}
+
+    def flush(self, snapshot):
+        """Атомарно записывает снимок через временный файл"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        pass
+
+
+class JournalPersistence:
+    """Журнал изменений токенов (одна JSON строка на операцию) с периодическим сжатием в снимок.
+
+    Запись операции стоит O(1): строка дописывается в конец журнала, а fsync
+    выполняется пачкой при очередном сбросе. Когда в журнале накапливается
+    ``compact_every`` записей, журнал переименовывается, текущее состояние
+    пишется снимком, и старый журнал удаляется.
+    """
+
+    def __init__(self, snapshot_path, journal_path, compact_every=1000):
+        self.snapshot = SnapshotPersistence(snapshot_path)
+        self.journal_path = journal_path
+        self.compacting_path = f"{journal_path}.old"
+        self.compact_every = compact_every
+        self._entries = 0
+        self._file = None
+
+    def _open_journal(self):
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _replay(self, path, tokens):
+        """Применяет операции журнала к словарю токенов, возвращает число записей"""
+        if not os.path.exists(path):
+            return 0
+        entries = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Недописанная последняя строка после аварийного завершения
+                    logger.warning(f"Пропущена поврежденная запись журнала токенов: {path}")
+                    continue
+                if entry['op'] == 'expire':
+                    tokens.pop(entry['token'], None)
+                else:
+                    tokens[entry['token']] = entry['data']
+                entries += 1
+        return entries
+
+    def load(self):
+        """Восстанавливает токены: снимок + незавершённое сжатие + журнал"""
+        tokens = self.snapshot.load()
+        self._replay(self.compacting_path, tokens)
+        self._entries = self._replay(self.journal_path, tokens)
+        return tokens
+
+    def record(self, op, token, token_data):
+        """Дописывает операцию в журнал"""
+        if self._file is None:
+            self._open_journal()
+        entry = {'op': op, 'token': token}
+        if token_data is not None:
+            entry['data'] = token_data
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._entries += 1
+
+    def prepare_flush(self, tokens):
+        """Под блокировкой хранилища начинает сжатие, если журнал разросся"""
+        if self._entries < self.compact_every:
+            return None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.compacting_path):
+            # Прошлое сжатие не записало снимок: .old ещё нужен, дописываем к нему журнал,
+            # чтобы при загрузке операции применились в том же порядке
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'rb') as src, open(self.compacting_path, 'ab') as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.journal_path)
+        elif os.path.exists(self.journal_path):
+            os.replace(self.journal_path, self.compacting_path)
+        self._entries = 0
+        return self.snapshot.prepare_flush(tokens)
+
+    def flush(self, snapshot):
+        """Сбрасывает журнал на диск и завершает сжатие, если оно начато"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        if snapshot is not None:
+            self.snapshot.flush(snapshot)
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+            logger.info(f"Журнал токенов сжат, активных токенов: {len(snapshot)}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TokenStore:
+    """Хранилище токенов авторизации в памяти с индексом истечения.
+
+    Все проверки выполняются по словарю в памяти, а на диск изменения
+    уходят отложенно: фоновый поток раз в ``flush_interval`` секунд
+    передаёт накопленное состояние объекту persistence.
+    """
+
+    def __init__(self, persistence=None, flush_interval=1.0):
+        self._tokens = {}
+        self._expiry = []  # куча (expires_at, token)
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._persistence = persistence
+        self._flush_interval = flush_interval
+        self._dirty = False
+        self._stop = threading.Event()
+        self._flusher = None
+        self._listeners = []
+
+    def load(self):
+        """Загружает токены из persistence, отбрасывая истекшие"""
+        if not self._persistence:
+            return
+        try:
+            loaded_tokens = self._persistence.load()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки токенов: {e}")
+            loaded_tokens = {}
+        current_time = time.time()
+        with self._lock:
+            self._tokens = {
+                k: v for k, v in loaded_tokens.items()
+                if v.get('expires_at', 0) > current_time
+            }
+            self._expiry = [(v['expires_at'], k) for k, v in self._tokens.items()]
+            heapq.heapify(self._expiry)
+            self._dirty = len(self._tokens) != len(loaded_tokens)
+        logger.info(f"Загружено активных токенов: {len(self._tokens)}")
+
+    def start(self):
+        """Запускает фоновый поток отложенной записи"""
+        if not self._persistence or self._flusher:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name='token-store-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self._flush_interval):
+            self.purge_expired()
+            self.flush()
+
+    def _mark(self, op, token, token_data):
+        self._dirty = True
+        if self._persistence:
+            try:
+                self._persistence.record(op, token, token_data)
+            except Exception as e:
+                logger.error(f"Ошибка записи изменения токена: {e}")
+
+    def create(self, token, ttl, **fields):
+        """Создаёт токен со сроком действия ttl секунд"""
+        token_data = {
+            'expires_at': time.time() + ttl,
+            'status': 'pending',
+            'user_data': None,
+            **fields
+        }
+        with self._lock:
+            self._tokens[token] = token_data
+            heapq.heappush(self._expiry, (token_data['expires_at'], token))
+            self._mark('generate', token, dict(token_data))
+        return dict(token_data)
+
+    def get(self, token):
+        """Возвращает копию данных действующего токена или None"""
+        with self._lock:
+            token_data = self._tokens.get(token)
+            if token_data is None:
+                return None
+            if token_data['expires_at'] < time.time():
+                del self._tokens[token]
+                self._mark('expire', token, None)
+                return None
+            return dict(token_data)
+
+    def update(self, token, **fields):
+        """Обновляет поля действующего токена, возвращает False если токена нет"""
+        with self._lock:
+            token_data = self._tokens.get(token)
+            if token_data is None or token_data['expires_at'] < time.time():
+                return False
+            token_data.update(fields)
+            self._mark('authorize', token, dict(token_data))
+            self._changed.notify_all()
+        for listener in self._listeners:
+            listener(token)
+        return True
+
+    def add_listener(self, callback):
+        """Регистрирует callback(token), вызываемый после изменения токена"""
+        self._listeners.append(callback)
+
+    def wait(self, token, timeout):
+        """Ждёт, пока токен перестанет быть pending, не дольше timeout секунд.
+
+        Возвращает копию данных токена (pending, если время вышло) или None,
+        если токен не найден или истёк.
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            while True:
+                token_data = self.get(token)
+                if token_data is None or token_data['status'] != 'pending':
+                    return token_data
+                remaining = min(deadline, token_data['expires_at']) - time.time()
+                if remaining <= 0:
+                    return token_data
+                self._changed.wait(remaining)
+
+    def purge_expired(self):
+        """Удаляет все истекшие токены за один проход по куче"""
+        current_time = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= current_time:
+                expires_at, token = heapq.heappop(self._expiry)
+                token_data = self._tokens.get(token)
+                if token_data is not None and token_data['expires_at'] == expires_at:
+                    del self._tokens[token]
+                    self._mark('expire', token, None)
+                    removed += 1
+        if removed:
+            logger.info(f"Удалено истекших токенов: {removed}")
+        return removed
+
+    def flush(self):
+        """Сохраняет накопленные изменения, если они есть"""
+        if not self._persistence:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = self._persistence.prepare_flush(self._tokens)
+                self._dirty = False
+            try:
+                self._persistence.flush(snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения токенов: {e}")
+                with self._lock:
+                    self._dirty = True
+
+    def close(self):
+        """Останавливает фоновую запись и сбрасывает изменения на диск"""
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join(timeout=self._flush_interval * 2)
+        self.flush()
+        if self._persistence:
+            self._persistence.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tokens)
+
+
+class AsyncTokenWaiter:
+    """Ожидание авторизации токена в asyncio без занятого потока на каждый запрос.
+
+    Ожидающие корутины подписываются на изменения токена через
+    TokenStore.add_listener; уведомление из любого потока будит их
+    через call_soon_threadsafe.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._waiters = {}  # токен -> множество (event loop, asyncio.Event)
+        self._lock = threading.Lock()
+        store.add_listener(self._notify)
+
+    def _notify(self, token):
+        with self._lock:
+            waiters = list(self._waiters.get(token, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, token, timeout):
+        """То же, что TokenStore.wait, но не блокирует event loop"""
+        deadline = time.time() + timeout
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(token, set()).add(waiter)
+        try:
+            while True:
+                token_data = self._store.get(token)
+                if token_data is None or token_data['status'] != 'pending':
+                    return token_data
+                remaining = min(deadline, token_data['expires_at']) - time.time()
+                if remaining <= 0:
+                    return token_data
+                waiter[1].clear()
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(token)
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[token]
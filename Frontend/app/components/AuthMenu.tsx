@@ -25,6 +25,7 @@ export default function AuthMenu({ isDark, onClose, onLogin }: AuthMenuProps) {
   const [isChecking, setIsChecking] = useState(false)
   const [botUsername, setBotUsername] = useState('phoenixllab_bot') // Имя бота без @
   const checkIntervalRef = useRef<NodeJS.Timeout | null>(null)
+  const eventSourceRef = useRef<EventSource | null>(null)
 
   useEffect(() => {
     // Проверяем, есть ли сохраненный пользователь
@@ -43,10 +44,13 @@ export default function AuthMenu({ isDark, onClose, onLogin }: AuthMenuProps) {
     generateToken()
 
     return () => {
-      // Очищаем интервал при размонтировании
+      // Очищаем интервал и SSE соединение при размонтировании
       if (checkIntervalRef.current) {
         clearInterval(checkIntervalRef.current)
       }
+      if (eventSourceRef.current) {
+        eventSourceRef.current.close()
+      }
     }
   }, [])
 
@@ -74,9 +78,56 @@ export default function AuthMenu({ isDark, onClose, onLogin }: AuthMenuProps) {
     }
   }
 
+  const completeLogin = (loggedUser: TelegramUser) => {
+    setUser(loggedUser)
+    onLogin(loggedUser)
+    localStorage.setItem('telegram_user', JSON.stringify(loggedUser))
+    setIsChecking(false)
+  }
+
   const startTokenCheck = (token: string) => {
     setIsChecking(true)
-    
+
+    // Ждём авторизации через SSE, при ошибке соединения переходим на опрос
+    if (typeof EventSource === 'undefined') {
+      startTokenPolling(token)
+      return
+    }
+
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close()
+    }
+    const eventSource = new EventSource(`${API_URL}/api/auth/wait/${token}`)
+    eventSourceRef.current = eventSource
+
+    eventSource.addEventListener('authorized', (event) => {
+      eventSource.close()
+      eventSourceRef.current = null
+      try {
+        const data = JSON.parse((event as MessageEvent).data)
+        if (data.user) {
+          completeLogin(data.user)
+        }
+      } catch (error) {
+        console.error('Ошибка разбора события авторизации:', error)
+      }
+    })
+
+    eventSource.addEventListener('expired', () => {
+      eventSource.close()
+      eventSourceRef.current = null
+      setIsChecking(false)
+    })
+
+    eventSource.onerror = () => {
+      if (eventSourceRef.current !== eventSource) return
+      eventSource.close()
+      eventSourceRef.current = null
+      startTokenPolling(token)
+    }
+  }
+
+  const startTokenPolling = (token: string) => {
     checkIntervalRef.current = setInterval(async () => {
       try {
         const response = await fetch(`${API_URL}/api/auth/verify-token`, {
@@ -90,15 +141,11 @@ export default function AuthMenu({ isDark, onClose, onLogin }: AuthMenuProps) {
         if (response.ok) {
           const data = await response.json()
           if (data.success && data.authorized && data.user) {
-            setUser(data.user)
-            onLogin(data.user)
-            localStorage.setItem('telegram_user', JSON.stringify(data.user))
-            
             if (checkIntervalRef.current) {
               clearInterval(checkIntervalRef.current)
               checkIntervalRef.current = null
             }
-            setIsChecking(false)
+            completeLogin(data.user)
           }
         }
       } catch (error) {
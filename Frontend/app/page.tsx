@@ -107,7 +107,7 @@ export default function Home() {
     setShowChannels(false)
 
     try {
-      const response = await fetch(`${API_URL}/api/rewrite-article`, {
+      const response = await fetch(`${API_URL}/api/rewrite-article/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
@@ -119,15 +119,46 @@ export default function Home() {
         })
       })
 
-      const data = await response.json()
-
-      if (data.success) {
-        setCurrentArticleText(data.text)
-        setResultText(data.text)
-        setShowResult(true)
-        setShowChannels(false)
-      } else {
+      // Ошибки валидации приходят обычным JSON ответом
+      if (!response.body || !response.headers.get('Content-Type')?.includes('text/event-stream')) {
+        const data = await response.json()
         alert(`Ошибка: ${data.error}`)
+        return
+      }
+
+      // Показываем текст по мере генерации, итоговый очищенный текст приходит в событии done
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let streamedText = ''
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        const events = buffer.split('\n\n')
+        buffer = events.pop() || ''
+        for (const rawEvent of events) {
+          const eventName = rawEvent.match(/^event: (.*)$/m)?.[1]
+          const payload = rawEvent.match(/^data: (.*)$/m)?.[1]
+          if (!eventName || !payload) continue
+          const data = JSON.parse(payload)
+
+          if (eventName === 'chunk') {
+            streamedText += data.text
+            setResultText(streamedText)
+            setShowResult(true)
+            setLoading(false)
+          } else if (eventName === 'done') {
+            setCurrentArticleText(data.text)
+            setResultText(data.text)
+            setShowResult(true)
+            setShowChannels(false)
+          } else if (eventName === 'error') {
+            alert(`Ошибка: ${data.error}`)
+          }
+        }
       }
     } catch (error) {
       console.error('Ошибка рерайта статьи:', error)
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(path):
+    """Межпроцессная эксклюзивная блокировка на отдельном .lock файле"""
+    with open(path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _signature(stat):
+    # Новый файл после rename получает новый inode, поэтому запись не
+    # теряется даже при одинаковом mtime
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class ChannelRegistry:
+    """Список каналов рассылки в памяти (словарь по id) поверх channels.json.
+
+    Файл перечитывается, только когда изменились его inode/mtime/размер, —
+    на каждое обращение приходится один stat. Запись идёт под межпроцессной
+    блокировкой через временный файл и os.replace, так что бот и бэкенд
+    никогда не видят файл наполовину записанным и не затирают изменения
+    друг друга.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._channels = {}  # id -> {'id', 'name', ...}, порядок добавления сохраняется
+        self._ordered = (None, [])  # (словарь, из которого построен список, список каналов)
+        self._signature = None
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """callback(registry) вызывается после каждого изменения списка (своего или другого процесса)"""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменения каналов: {e}")
+
+    def _read(self):
+        """Читает файл, если он изменился; возвращает True, если список обновлён"""
+        try:
+            signature = _signature(os.stat(self.path))
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return False
+
+        channels = {}
+        if signature is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    # Подпись берём у открытого файла: она точно соответствует прочитанному
+                    signature = _signature(os.fstat(f.fileno()))
+                    data = json.load(f)
+                for channel in data.get('channels', []):
+                    channel['id'] = str(channel['id'])
+                    channels[channel['id']] = channel
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                # Оставляем прежний список, повторно разбираем файл только после следующего изменения
+                logger.error(f"Ошибка загрузки каналов: {e}")
+                self._signature = signature
+                return False
+        self._channels = channels
+        self._signature = signature
+        return True
+
+    def refresh(self):
+        """Подхватывает изменения файла, сделанные другим процессом"""
+        with self._lock:
+            changed = self._read()
+        if changed:
+            self._notify()
+
+    def all(self):
+        """Все каналы в порядке добавления"""
+        self.refresh()
+        return list(self._channels.values())
+
+    def get(self, channel_id):
+        """Канал по id за O(1) или None"""
+        self.refresh()
+        return self._channels.get(str(channel_id))
+
+    def page(self, offset, limit):
+        """Срез списка каналов для постраничного вывода: (каналы, всего).
+
+        Упорядоченный список строится один раз после каждого изменения, поэтому срез стоит O(limit).
+        """
+        self.refresh()
+        channels = self._channels
+        source, ordered = self._ordered
+        if source is not channels:
+            ordered = list(channels.values())
+            self._ordered = (channels, ordered)
+        return ordered[offset:offset + limit], len(ordered)
+
+    def __contains__(self, channel_id):
+        return self.get(channel_id) is not None
+
+    def __len__(self):
+        self.refresh()
+        return len(self._channels)
+
+    def _write(self, channels):
+        """Атомарно записывает список через временный файл в той же папке"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.channels.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'channels': list(channels.values())}, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._channels = channels
+        self._signature = _signature(os.stat(self.path))
+
+    def _exclusive(self):
+        """Межпроцессная блокировка на время чтения-изменения-записи"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return file_lock(self.lock_path)
+
+    def _modify(self, change):
+        """Перечитывает файл под блокировкой, применяет change(channels) и записывает результат.
+
+        change возвращает False, если изменять нечего, — тогда файл не переписывается.
+        """
+        with self._lock, self._exclusive():
+            self._read()
+            channels = dict(self._channels)
+            if change(channels) is False:
+                return False
+            self._write(channels)
+        self._notify()
+        return True
+
+    def add(self, channel_id, name=None, **fields):
+        """Добавляет канал; False, если он уже есть. Ошибки записи пробрасываются (OSError)"""
+        channel_id = str(channel_id)
+        if self.get(channel_id) is not None:
+            return False
+
+        def change(channels):
+            if channel_id in channels:
+                return False
+            channels[channel_id] = {'id': channel_id, 'name': name or channel_id, **fields}
+
+        return self._modify(change)
+
+    def update(self, channel_id, **fields):
+        """Обновляет поля канала; False, если канала нет"""
+        channel_id = str(channel_id)
+
+        def change(channels):
+            if channel_id not in channels:
+                return False
+            channels[channel_id] = {**channels[channel_id], **fields}
+
+        return self._modify(change)
+
+    def update_many(self, updates):
+        """Обновляет поля нескольких каналов одной записью: {id: поля}; отсутствующие каналы пропускаются"""
+        updates = {str(channel_id): fields for channel_id, fields in updates.items()}
+
+        def change(channels):
+            changed = False
+            for channel_id, fields in updates.items():
+                if channel_id in channels:
+                    channels[channel_id] = {**channels[channel_id], **fields}
+                    changed = True
+            return changed
+
+        return self._modify(change)
+
+    def remove(self, channel_id):
+        """Удаляет канал; False, если его не было"""
+        channel_id = str(channel_id)
+        if self.get(channel_id) is None:
+            return False
+        return self._modify(lambda channels: channels.pop(channel_id, None) is not None)
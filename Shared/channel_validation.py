@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых канал считается недоступным: бот удалён, канал не найден и т.п.
+DEAD_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+
+
+async def fetch_chat_info(bot, chat_id):
+    """Название канала и право бота публиковать в нём.
+
+    status: ok — бот может публиковать, dead — канал недоступен или прав нет,
+    unknown — Telegram не ответил (сетевая ошибка, flood control), судить нельзя.
+    """
+    info = {'id': str(chat_id), 'title': None, 'username': None, 'can_post': False,
+            'status': 'unknown', 'error': None, 'checked_at': time.time()}
+    try:
+        chat = await bot.get_chat(chat_id)
+        info['title'] = chat.title
+        info['username'] = chat.username
+        member = await bot.get_chat_member(chat_id, bot.id)
+    except DEAD_ERRORS as e:
+        info['status'] = 'dead'
+        info['error'] = str(e)
+        return info
+    except Exception as e:
+        info['error'] = str(e)
+        return info
+
+    if member.status == 'creator':
+        info['can_post'] = True
+    elif member.status == 'administrator':
+        # В группах у администратора нет флага can_post_messages — публиковать он может всегда
+        info['can_post'] = getattr(member, 'can_post_messages', None) is not False
+    elif chat.type != 'channel':
+        info['can_post'] = member.status == 'member' or getattr(member, 'can_send_messages', False)
+    info['status'] = 'ok' if info['can_post'] else 'dead'
+    if not info['can_post']:
+        info['error'] = 'Бот не может публиковать в канале (нет прав администратора)'
+    return info
+
+
+class ChatInfoCache:
+    """Кэш сведений о каналах (fetch_chat_info) со сроком жизни ttl секунд.
+
+    Одновременные запросы одного канала разделяют один вызов Telegram API.
+    Результаты unknown не кэшируются. Работает внутри одного event loop.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._entries = {}  # id -> (истекает, сведения)
+        self._inflight = {}  # id -> задача запроса
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, bot, chat_id, refresh=False):
+        chat_id = str(chat_id)
+        entry = self._entries.get(chat_id)
+        if entry and not refresh and entry[0] > time.monotonic():
+            self.hits += 1
+            return dict(entry[1])
+        self.misses += 1
+
+        task = self._inflight.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(fetch_chat_info(bot, chat_id))
+            self._inflight[chat_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(chat_id, None))
+        info = await asyncio.shield(task)
+        if info['status'] != 'unknown':
+            self._entries[chat_id] = (time.monotonic() + self.ttl, info)
+        return dict(info)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+async def validate_channels(bot, channels, cache, concurrency=5, refresh=True):
+    """Проверяет все каналы параллельно (не больше concurrency одновременно), порядок сохраняется"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(channel):
+        async with semaphore:
+            info = await cache.get(bot, channel['id'], refresh=refresh)
+        return {**info, 'name': channel.get('name', channel['id'])}
+
+    return await asyncio.gather(*(check(channel) for channel in channels))
+
+
+def mark_channels(registry, results):
+    """Записывает статус проверки в реестр каналов одной записью; unknown не меняет прежний статус.
+
+    Возвращает число недоступных каналов.
+    """
+    updates = {
+        info['id']: {'status': info['status'], 'error': info['error'], 'checked_at': info['checked_at']}
+        for info in results if info['status'] != 'unknown'
+    }
+    if updates:
+        registry.update_many(updates)
+    dead = sum(1 for info in results if info['status'] == 'dead')
+    if dead:
+        logger.warning(f"Недоступных каналов: {dead} из {len(results)}")
+    return dead
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+from Shared.channel_registry import ChannelRegistry
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL DEFAULT '{}',
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS auth_tokens (
+    token TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS auth_tokens_expires_at ON auth_tokens (expires_at);
+CREATE TABLE IF NOT EXISTS send_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT,
+    channel_id TEXT NOT NULL,
+    channel_name TEXT,
+    success INTEGER NOT NULL,
+    error TEXT,
+    sent_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS send_results_channel ON send_results (channel_id, sent_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+@contextmanager
+def transaction(conn):
+    """Транзакция с блокировкой записи сразу (BEGIN IMMEDIATE): без взаимоблокировок читатель→писатель"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+class SQLiteStorage:
+    """Общая для бота и бэкенда SQLite база в режиме WAL.
+
+    В WAL читатели не блокируют писателя и наоборот, поэтому оба процесса
+    работают с базой одновременно; писатели ждут друг друга до busy_timeout.
+    Каждый компонент держит своё соединение (см. connect).
+    """
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self.connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        """Новое соединение в режиме autocommit (транзакции открываются явно)"""
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def migrate_json(self, channels_path=None, tokens_path=None):
+        """Однократно переносит channels.json и auth_tokens.json в базу.
+
+        Каждый файл переносится один раз (отметка в таблице meta), так что
+        бот и бэкенд могут вызывать миграцию при каждом старте.
+        """
+        with closing(self.connect()) as conn:
+            if channels_path:
+                self._migrate_file(conn, 'channels', channels_path, self._import_channels)
+            if tokens_path:
+                self._migrate_file(conn, 'auth_tokens', tokens_path, self._import_tokens)
+
+    def _migrate_file(self, conn, name, path, importer):
+        key = f'migrated:{name}'
+        with transaction(conn):
+            if conn.execute('SELECT 1 FROM meta WHERE key = ?', (key,)).fetchone():
+                return
+            count = 0
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except ValueError as e:
+                    logger.error(f"Файл {path} поврежден, миграция пропущена: {e}")
+                    data = None
+                if data:
+                    count = importer(conn, data)
+            conn.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (key, str(time.time())))
+        logger.info(f"Миграция {name} из {path} в SQLite: перенесено записей: {count}")
+
+    @staticmethod
+    def _import_channels(conn, data):
+        now = time.time()
+        rows = []
+        for channel in data.get('channels', []):
+            channel = dict(channel)
+            channel_id = str(channel.pop('id'))
+            name = channel.pop('name', None) or channel_id
+            rows.append((channel_id, name, json.dumps(channel, ensure_ascii=False), now))
+        conn.executemany('INSERT OR IGNORE INTO channels (id, name, data, added_at) VALUES (?, ?, ?, ?)', rows)
+        return len(rows)
+
+    @staticmethod
+    def _import_tokens(conn, data):
+        now = time.time()
+        rows = [
+            (token, token_data.get('status', 'pending'), token_data['expires_at'], json.dumps(token_data, ensure_ascii=False))
+            for token, token_data in data.items()
+            if token_data.get('expires_at', 0) > now
+        ]
+        conn.executemany('INSERT OR IGNORE INTO auth_tokens (token, status, expires_at, data) VALUES (?, ?, ?, ?)', rows)
+        return len(rows)
+
+
+class SQLiteChannelRegistry(ChannelRegistry):
+    """Реестр каналов поверх таблицы channels с тем же интерфейсом, что и ChannelRegistry.
+
+    Кэш в памяти сбрасывается, когда меняется PRAGMA data_version, — счётчик
+    растёт при каждой фиксации транзакции другим соединением, так что
+    проверка свежести стоит одного запроса без чтения таблицы.
+    """
+
+    def __init__(self, storage):
+        super().__init__(storage.path)
+        self._conn = storage.connect()
+
+    def _exclusive(self):
+        return transaction(self._conn)
+
+    def _read(self):
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._signature:
+            return False
+        channels = {}
+        for channel_id, name, data in self._conn.execute('SELECT id, name, data FROM channels ORDER BY rowid'):
+            channels[channel_id] = {'id': channel_id, 'name': name, **json.loads(data)}
+        self._channels = channels
+        self._signature = version
+        return True
+
+    def _write(self, channels):
+        """Пишет только разницу с текущим списком (вызывается внутри транзакции _modify)"""
+        removed = [(channel_id,) for channel_id in self._channels if channel_id not in channels]
+        now = time.time()
+        changed = []
+        for channel_id, channel in channels.items():
+            if self._channels.get(channel_id) == channel:
+                continue
+            fields = {k: v for k, v in channel.items() if k not in ('id', 'name')}
+            changed.append((channel_id, channel['name'], json.dumps(fields, ensure_ascii=False), now))
+        self._conn.executemany('DELETE FROM channels WHERE id = ?', removed)
+        self._conn.executemany(
+            'INSERT INTO channels (id, name, data, added_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET name = excluded.name, data = excluded.data',
+            changed
+        )
+        self._channels = channels
+
+
+class SQLiteTokenPersistence:
+    """Persistence для TokenStore: изменения токенов копятся в памяти и пишутся одной транзакцией при сбросе.
+
+    Повторные изменения одного токена между сбросами схлопываются, а истекшие
+    строки удаляются по индексу expires_at.
+    """
+
+    def __init__(self, storage):
+        self._conn = storage.connect()
+        self._pending = {}  # токен -> данные или None (удалить)
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = self._conn.execute('SELECT token, data FROM auth_tokens WHERE expires_at > ?', (time.time(),))
+        return {token: json.loads(data) for token, data in rows}
+
+    def record(self, op, token, token_data):
+        with self._lock:
+            self._pending[token] = token_data
+
+    def prepare_flush(self, tokens):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def flush(self, snapshot):
+        upserts = [
+            (token, token_data.get('status', 'pending'), token_data['expires_at'], json.dumps(token_data, ensure_ascii=False))
+            for token, token_data in snapshot.items() if token_data is not None
+        ]
+        deletes = [(token,) for token, token_data in snapshot.items() if token_data is None]
+        try:
+            with transaction(self._conn):
+                self._conn.executemany(
+                    'INSERT INTO auth_tokens (token, status, expires_at, data) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (token) DO UPDATE SET status = excluded.status, '
+                    'expires_at = excluded.expires_at, data = excluded.data',
+                    upserts
+                )
+                self._conn.executemany('DELETE FROM auth_tokens WHERE token = ?', deletes)
+                self._conn.execute('DELETE FROM auth_tokens WHERE expires_at <= ?', (time.time(),))
+        except Exception:
+            # Возвращаем изменения в очередь; более новые записи того же токена важнее
+            with self._lock:
+                self._pending = {**snapshot, **self._pending}
+            raise
+
+    def close(self):
+        self._conn.close()
+
+
+class SendHistory:
+    """История отправок в каналы (таблица send_results)"""
+
+    def __init__(self, storage):
+        self._conn = storage.connect()
+        self._lock = threading.Lock()
+
+    def record_many(self, results, job_id=None):
+        """Сохраняет результаты рассылки: список (канал, failure) как у on_result в send_to_channels"""
+        now = time.time()
+        rows = [
+            (job_id, channel['id'], channel.get('name'), failure is None, failure['error'] if failure else None, now)
+            for channel, failure in results
+        ]
+        with self._lock, transaction(self._conn):
+            self._conn.executemany(
+                'INSERT INTO send_results (job_id, channel_id, channel_name, success, error, sent_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def recent(self, channel_id=None, limit=50):
+        """Последние отправки, новые первыми; с channel_id — только в этот канал"""
+        query = 'SELECT job_id, channel_id, channel_name, success, error, sent_at FROM send_results'
+        params = []
+        if channel_id:
+            query += ' WHERE channel_id = ?'
+            params.append(str(channel_id))
+        query += ' ORDER BY sent_at DESC, id DESC LIMIT ?'
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {'job_id': job_id, 'channel_id': channel_id, 'channel_name': name,
+             'success': bool(success), 'error': error, 'sent_at': sent_at}
+            for job_id, channel_id, name, success, error, sent_at in rows
+        ]
@@ -0,0 +1,121 @@
+import asyncio
+import bisect
+import json
+import logging
+import random
+import time
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых запрос к бэкенду повторяется
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Верхние границы корзин гистограммы задержек (секунды)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами (как у Prometheus, но без накопления)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — больше максимальной границы
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+
+    def to_dict(self):
+        count = sum(self.counts)
+        labels = [f"<={bound}" for bound in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            'count': count,
+            'errors': self.errors,
+            'avg': round(self.total / count, 4) if count else None,
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+
+class BackendClient:
+    """Клиент API бэкенда с одной долгоживущей сессией на весь процесс бота.
+
+    Сессия создаётся в start() (внутри event loop) и держит пул keep-alive
+    соединений, поэтому нажатия кнопок не платят за установку соединения.
+    Ошибки соединения и RETRY_STATUSES повторяются с экспоненциальной
+    задержкой со случайным разбросом, чтобы одновременные повторы не
+    приходили к бэкенду волной.
+    """
+
+    def __init__(self, base_url, limit=20, timeout=10, retries=2, backoff_factor=0.3):
+        self.base_url = base_url.rstrip('/')
+        self.limit = limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.session = None
+        self.latency = {}  # путь -> LatencyHistogram
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _histogram(self, path):
+        if path not in self.latency:
+            self.latency[path] = LatencyHistogram()
+        return self.latency[path]
+
+    def _delay(self, attempt):
+        # Полный разброс: равномерно от 0 до экспоненциальной задержки
+        return random.uniform(0, self.backoff_factor * (2 ** attempt))
+
+    async def post_json(self, path, payload):
+        """POST с JSON телом; возвращает (статус, разобранный JSON или None, текст ответа).
+
+        Тело читается один раз. После исчерпания повторов возвращается
+        последний ответ или пробрасывается aiohttp.ClientError.
+        """
+        await self.start()
+        histogram = self._histogram(path)
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            started = time.monotonic()
+            try:
+                async with self.session.post(url, json=payload) as response:
+                    body = await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                histogram.errors += 1
+                if attempt == self.retries:
+                    raise aiohttp.ClientError(f"{url}: {type(e).__name__}: {e}") from e
+                delay = self._delay(attempt)
+                logger.warning(f"Повтор запроса {url} через {delay:.2f} с: {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+                continue
+            histogram.observe(time.monotonic() - started)
+            if status in RETRY_STATUSES and attempt < self.retries:
+                delay = self._delay(attempt)
+                logger.warning(f"Повтор запроса {url} через {delay:.2f} с: статус {status}")
+                await asyncio.sleep(delay)
+                continue
+            text = body.decode('utf-8', errors='replace')
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                data = None
+            return status, data, text
+
+    def stats(self):
+        """Гистограммы задержек запросов к бэкенду по путям"""
+        return {path: histogram.to_dict() for path, histogram in self.latency.items()}
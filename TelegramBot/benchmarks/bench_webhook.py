@@ -0,0 +1,124 @@
+"""Проверка и замер режима webhook на локальном поддельном Telegram Bot API.
+
+Поднимает поддельный Bot API (отвечает на getMe, setWebhook, sendMessage и
+т.д.), запускает приложение бота из create_webhook_app() и отправляет в
+webhook пачку обновлений /help одновременно. Замеряется время от отправки
+обновления до прихода ответа бота (sendMessage) в поддельный API; запрос с
+неверным секретом должен получить 401.
+
+Запуск из папки TelegramBot:
+    python benchmarks/bench_webhook.py [количество обновлений]
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from aiohttp import ClientSession, web
+
+FAKE_API_PORT = 8781
+WEBHOOK_PORT = 8782
+SECRET = 'bench-secret'
+
+os.environ.update({
+    'BOT_TOKEN': os.environ.get('BOT_TOKEN', '123456:bench'),
+    'BOT_MODE': 'webhook',
+    'TELEGRAM_API_URL': f'http://127.0.0.1:{FAKE_API_PORT}',
+    'WEBHOOK_URL': f'http://127.0.0.1:{WEBHOOK_PORT}',
+    'WEBHOOK_SECRET': SECRET,
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+# Журналы запросов и обработки апдейтов забивают вывод замера
+for name in ('aiohttp.access', 'aiogram.event', 'backend_client'):
+    logging.getLogger(name).setLevel(logging.WARNING)
+
+
+class FakeTelegramAPI:
+    """Поддельный Bot API: запоминает вызовы методов и время прихода ответов бота"""
+
+    def __init__(self):
+        self.calls = {}
+        self.replies = {}  # chat_id -> время sendMessage
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        data = dict(await request.post()) if request.content_type != 'application/json' else await request.json()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif method == 'sendMessage':
+            chat_id = int(data['chat_id'])
+            self.replies[chat_id] = time.perf_counter()
+            if len(self.replies) >= self.expected:
+                self.done.set()
+            result = {'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': data.get('text')}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+
+def make_update(i):
+    return {
+        'update_id': i,
+        'message': {
+            'message_id': i,
+            'date': 0,
+            'chat': {'id': 1000 + i, 'type': 'private'},
+            'from': {'id': 1000 + i, 'is_bot': False, 'first_name': 'Bench'},
+            'text': '/help',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}]
+        }
+    }
+
+
+async def start_site(app, port):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+async def run(count):
+    fake = FakeTelegramAPI()
+    fake.expected = count
+    fake_app = web.Application()
+    fake_app.router.add_post('/bot{token}/{method}', fake.handle)
+    fake_runner = await start_site(fake_app, FAKE_API_PORT)
+    bot_runner = await start_site(main.create_webhook_app(), WEBHOOK_PORT)
+
+    url = f'http://127.0.0.1:{WEBHOOK_PORT}{main.WEBHOOK_PATH}'
+    try:
+        async with ClientSession() as session:
+            async with session.post(url, json=make_update(0), headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'}) as response:
+                print(f"Неверный секрет: статус {response.status}")
+
+            sent = {}
+
+            async def deliver(i):
+                sent[1000 + i] = time.perf_counter()
+                async with session.post(url, json=make_update(i), headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as response:
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(deliver(i) for i in range(1, count + 1)))
+            await asyncio.wait_for(fake.done.wait(), 30)
+            elapsed = time.perf_counter() - started
+
+        latencies = sorted(fake.replies[chat_id] - sent[chat_id] for chat_id in sent)
+        print(f"setWebhook вызван: {fake.calls.get('setWebhook', 0)} раз")
+        print(f"Обновлений: {count}, ответов: {len(fake.replies)}, всего {elapsed:.3f} с")
+        print(f"Задержка ответа: p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} мс")
+    finally:
+        await bot_runner.cleanup()
+        await fake_runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -1,17 +1,30 @@
 import os
-import json
+import sys
 import logging
+from html import escape
 import aiohttp
+from aiohttp import web
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from dotenv import load_dotenv
+from backend_client import BackendClient
 
 # Загрузка переменных окружения
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Общие с бэкендом модули лежат в папке Shared в корне проекта
+sys.path.append(BASE_DIR)
+from Shared.channel_registry import ChannelRegistry
+from Shared.channel_validation import ChatInfoCache, mark_channels, validate_channels
+from Shared.sqlite_storage import SQLiteChannelRegistry, SQLiteStorage
+from sqlite_fsm_storage import SQLiteFSMStorage
+
 env_path = os.path.join(BASE_DIR, '.env')
 if not os.path.exists(env_path):
     env_path = os.path.join(BASE_DIR, 'BOT_TOKEN.env')
@@ -29,66 +42,85 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в переменных окружения")
 
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+# Адрес Bot API: по умолчанию api.telegram.org, для локального Bot API сервера или тестов — свой
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Режим получения обновлений: polling (long polling) или webhook (aiohttp сервер,
+# обновления обрабатываются параллельно по мере поступления, можно запускать несколько реплик)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')  # внешний адрес, на который Telegram шлёт обновления
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None  # проверяется по заголовку X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
 
 # Файл для хранения каналов
 CHANNELS_FILE = os.path.join(BASE_DIR, "TelegramBot", "channels.json")
 
+# Хранилище каналов: json — channels.json, sqlite — общая с бэкендом база (STORAGE_DB_FILE)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+STORAGE_DB_FILE = os.getenv('STORAGE_DB_FILE') or os.path.join(BASE_DIR, "TelegramBot", "phoenix_lab.db")
+
+# Состояния диалогов (FSM): memory — в памяти процесса, sqlite — в базе STORAGE_DB_FILE
+# (переживают перезапуск и общие для нескольких процессов бота)
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory')
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 1024))
+
+database = None
+if STORAGE_BACKEND == 'sqlite' or FSM_STORAGE == 'sqlite':
+    database = SQLiteStorage(STORAGE_DB_FILE)
+
+# Каналы: общий с бэкендом реестр в памяти, файл (или база) перечитывается только при изменении
+if STORAGE_BACKEND == 'sqlite':
+    database.migrate_json(channels_path=CHANNELS_FILE)
+    channel_registry = SQLiteChannelRegistry(database)
+else:
+    channel_registry = ChannelRegistry(CHANNELS_FILE)
+
+bot_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=bot_session)
+storage = SQLiteFSMStorage(database, cache_size=FSM_CACHE_SIZE) if FSM_STORAGE == 'sqlite' else MemoryStorage()
+dp = Dispatcher(storage=storage)
+
 # URL API бэкенда
 API_URL = os.getenv('API_URL', 'http://localhost:5000')
 
+# Одна сессия с пулом keep-alive соединений к бэкенду на весь процесс (открывается при запуске бота)
+backend = BackendClient(
+    API_URL,
+    limit=int(os.getenv('BACKEND_HTTP_LIMIT', 20)),
+    timeout=float(os.getenv('BACKEND_HTTP_TIMEOUT', 10)),
+    retries=int(os.getenv('BACKEND_HTTP_RETRIES', 2))
+)
 
-def load_channels():
-    """Загружает список каналов из файла"""
-    if os.path.exists(CHANNELS_FILE):
-        try:
-            with open(CHANNELS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('channels', [])
-        except Exception as e:
-            logger.error(f"Ошибка загрузки каналов: {e}")
-            return []
-    return []
+# Сведения о каналах (название, права бота) кэшируются, чтобы не дёргать get_chat на каждое добавление
+CHAT_INFO_TTL = int(os.getenv('CHAT_INFO_TTL', 600))
+CHANNEL_VALIDATION_CONCURRENCY = int(os.getenv('CHANNEL_VALIDATION_CONCURRENCY', 5))
+chat_info_cache = ChatInfoCache(ttl=CHAT_INFO_TTL)
 
+# Сколько каналов показывать на одной странице /channels
+CHANNELS_PAGE_SIZE = int(os.getenv('CHANNELS_PAGE_SIZE', 10))
 
-def save_channels(channels):
-    """Сохраняет список каналов в файл"""
-    try:
-        with open(CHANNELS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({'channels': channels}, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка сохранения каналов: {e}")
-        return False
 
-
-def add_channel(channel_id, channel_name=None):
+def add_channel(channel_id, channel_name=None, **fields):
     """Добавляет канал в список"""
-    channels = load_channels()
-    channel_info = {
-        'id': str(channel_id),
-        'name': channel_name or str(channel_id)
-    }
-    
-    # Проверяем, нет ли уже такого канала
-    if any(ch['id'] == str(channel_id) for ch in channels):
-        return False, "Канал уже добавлен"
-    
-    channels.append(channel_info)
-    if save_channels(channels):
-        return True, "Канал успешно добавлен"
-    return False, "Ошибка сохранения"
+    try:
+        if not channel_registry.add(channel_id, channel_name, **fields):
+            return False, "Канал уже добавлен"
+    except OSError as e:
+        logger.error(f"Ошибка сохранения каналов: {e}")
+        return False, "Ошибка сохранения"
+    return True, "Канал успешно добавлен"
 
 
 def remove_channel(channel_id):
     """Удаляет канал из списка"""
-    channels = load_channels()
-    channels = [ch for ch in channels if ch['id'] != str(channel_id)]
-    if save_channels(channels):
-        return True, "Канал успешно удален"
-    return False, "Ошибка сохранения"
+    try:
+        channel_registry.remove(channel_id)
+    except OSError as e:
+        logger.error(f"Ошибка сохранения каналов: {e}")
+        return False, "Ошибка сохранения"
+    return True, "Канал успешно удален"
 
 
 # Состояния FSM
@@ -111,30 +143,24 @@ async def authorize_user(token: str, user: types.User):
     logger.info(f"API URL: {API_URL}/api/auth/authorize")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f'{API_URL}/api/auth/authorize',
-                json={
-                    'token': token,
-                    'user_data': user_data
-                },
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                response_text = await response.text()
-                logger.info(f"Ответ API: статус {response.status}, тело: {response_text}")
-                
-                if response.status == 200:
-                    try:
-                        result = await response.json()
-                        success = result.get('success', False)
-                        logger.info(f"Результат авторизации: {success}")
-                        return success
-                    except Exception as e:
-                        logger.error(f"Ошибка парсинга JSON ответа: {e}, тело: {response_text}")
-                        return False
-                else:
-                    logger.error(f"Ошибка авторизации: статус {response.status}, тело: {response_text}")
-                    return False
+        status, result, response_text = await backend.post_json(
+            '/api/auth/authorize',
+            {
+                'token': token,
+                'user_data': user_data
+            }
+        )
+        logger.info(f"Ответ API: статус {status}, тело: {response_text}")
+        
+        if status != 200:
+            logger.error(f"Ошибка авторизации: статус {status}, тело: {response_text}")
+            return False
+        if not isinstance(result, dict):
+            logger.error(f"Ошибка парсинга JSON ответа, тело: {response_text}")
+            return False
+        success = result.get('success', False)
+        logger.info(f"Результат авторизации: {success}")
+        return success
     except aiohttp.ClientError as e:
         logger.error(f"Ошибка подключения к API: {e}")
         return False
@@ -190,6 +216,8 @@ async def cmd_help(message: types.Message):
         "/start - Начать работу\n"
         "/channels - Показать список каналов\n"
         "/add_channel - Добавить новый канал\n"
+        "/validate_channels - Проверить доступность каналов\n"
+        "/stats - Задержки запросов к бэкенду\n"
         "/cancel - Отменить текущую операцию\n\n"
         "<b>Как добавить канал:</b>\n"
         "1. Добавьте бота в канал как администратора\n"
@@ -199,24 +227,41 @@ async def cmd_help(message: types.Message):
     )
 
 
-@dp.message(Command("channels"))
-async def cmd_channels(message: types.Message):
-    """Показывает список каналов для рассылки"""
-    channels = load_channels()
+@dp.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    """Гистограммы задержек запросов бота к бэкенду"""
+    stats = backend.stats()
+    if not stats:
+        await message.answer("📊 Запросов к бэкенду ещё не было.")
+        return
     
+    text = "📊 <b>Задержки запросов к бэкенду:</b>\n"
+    for path, histogram in stats.items():
+        avg = f"{histogram['avg'] * 1000:.0f} мс" if histogram['avg'] is not None else "—"
+        text += f"\n<code>{path}</code>: {histogram['count']} запросов, ошибок {histogram['errors']}, среднее {avg}\n"
+        for bucket, count in histogram['buckets'].items():
+            if count:
+                text += f"  {bucket} с: {count}\n"
+    await message.answer(text, parse_mode="HTML")
+
+
+def render_channels_page(offset):
+    """Текст и клавиатура одной страницы списка каналов; (None, None), если каналов нет"""
+    channels, total = channel_registry.page(offset, CHANNELS_PAGE_SIZE)
+    if not total:
+        return None, None
     if not channels:
-        await message.answer(
-            "❌ Каналы не настроены.\n\n"
-            "Используйте команду /add_channel для добавления канала."
-        )
-        return
+        # Каналы удалили, пока страница была открыта: показываем последнюю
+        offset = (total - 1) // CHANNELS_PAGE_SIZE * CHANNELS_PAGE_SIZE
+        channels, total = channel_registry.page(offset, CHANNELS_PAGE_SIZE)
     
     # Создаем клавиатуру с кнопками удаления
     keyboard_buttons = []
     channels_text = "📢 <b>Каналы для рассылки:</b>\n\n"
     
-    for i, channel in enumerate(channels):
-        channels_text += f"{i+1}. {channel['name']} (<code>{channel['id']}</code>)\n"
+    for i, channel in enumerate(channels, start=offset):
+        mark = " ⚠️ недоступен" if channel.get('status') == 'dead' else ""
+        channels_text += f"{i+1}. {channel['name']} (<code>{channel['id']}</code>){mark}\n"
         keyboard_buttons.append([
             InlineKeyboardButton(
                 text=f"❌ Удалить {channel['name']}",
@@ -224,7 +269,37 @@ async def cmd_channels(message: types.Message):
             )
         ])
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    # Навигация: в callback передаётся смещение страницы
+    if total > CHANNELS_PAGE_SIZE:
+        pages = -(-total // CHANNELS_PAGE_SIZE)
+        channels_text += f"\nСтраница {offset // CHANNELS_PAGE_SIZE + 1} из {pages}, всего каналов: {total}"
+        navigation = []
+        if offset > 0:
+            navigation.append(InlineKeyboardButton(
+                text="◀️ Назад",
+                callback_data=f"channels_page_{max(offset - CHANNELS_PAGE_SIZE, 0)}"
+            ))
+        if offset + CHANNELS_PAGE_SIZE < total:
+            navigation.append(InlineKeyboardButton(
+                text="Вперёд ▶️",
+                callback_data=f"channels_page_{offset + CHANNELS_PAGE_SIZE}"
+            ))
+        keyboard_buttons.append(navigation)
+    
+    return channels_text, InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
+
+@dp.message(Command("channels"))
+async def cmd_channels(message: types.Message):
+    """Показывает первую страницу списка каналов для рассылки"""
+    channels_text, keyboard = render_channels_page(0)
+    
+    if not channels_text:
+        await message.answer(
+            "❌ Каналы не настроены.\n\n"
+            "Используйте команду /add_channel для добавления канала."
+        )
+        return
     
     await message.answer(
         channels_text,
@@ -233,6 +308,46 @@ async def cmd_channels(message: types.Message):
     )
 
 
+@dp.callback_query(lambda c: c.data.startswith("channels_page_"))
+async def channels_page_callback(callback: types.CallbackQuery):
+    """Переключает страницу списка каналов"""
+    offset = callback.data.replace("channels_page_", "")
+    channels_text, keyboard = render_channels_page(int(offset) if offset.isdigit() else 0)
+    
+    if not channels_text:
+        await callback.answer()
+        await callback.message.edit_text("❌ Каналы не настроены.")
+        return
+    
+    await callback.answer()
+    await callback.message.edit_text(
+        channels_text,
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+
+
+@dp.message(Command("validate_channels"))
+async def cmd_validate_channels(message: types.Message):
+    """Проверяет, может ли бот публиковать во все каналы, и помечает недоступные"""
+    channels = channel_registry.all()
+    if not channels:
+        await message.answer("❌ Каналы не настроены.")
+        return
+    
+    await message.answer(f"🔎 Проверяю каналов: {len(channels)}...")
+    results = await validate_channels(bot, channels, chat_info_cache, concurrency=CHANNEL_VALIDATION_CONCURRENCY)
+    dead = mark_channels(channel_registry, results)
+    
+    text = f"✅ Доступно: {sum(1 for info in results if info['status'] == 'ok')} из {len(results)}\n"
+    problems = [info for info in results if info['status'] != 'ok']
+    if problems:
+        text += f"❌ Недоступно: {dead}, не удалось проверить: {len(problems) - dead}\n\n"
+        for info in problems:
+            text += f"• {escape(info['name'])} (<code>{info['id']}</code>): {escape(info['error'] or '')}\n"
+    await message.answer(text, parse_mode="HTML")
+
+
 @dp.message(Command("add_channel"))
 async def cmd_add_channel(message: types.Message, state: FSMContext):
     """Начинает процесс добавления канала"""
@@ -283,19 +398,23 @@ async def process_channel(message: types.Message, state: FSMContext):
         await message.answer("❌ Не удалось определить канал. Попробуйте ещё раз.")
         return
     
-    # Пытаемся получить информацию о канале
-    try:
-        chat = await bot.get_chat(channel_id)
-        channel_name = chat.title or chat.username or channel_id
-    except Exception as e:
-        logger.warning(f"Не удалось получить информацию о канале {channel_id}: {e}")
+    # Пытаемся получить информацию о канале и правах бота. Запрашиваем заново: права могли
+    # выдать только что, а устаревший отказ из кэша не должен попасть в реестр
+    info = await chat_info_cache.get(bot, channel_id, refresh=True)
+    channel_name = info['title'] or info['username'] or channel_name
+    if not info['can_post']:
+        logger.warning(f"Не удалось получить информацию о канале {channel_id}: {info['error']}")
         await message.answer(
             "⚠️ Не удалось получить информацию о канале.\n"
             "Убедитесь, что бот добавлен в канал как администратор."
         )
     
-    # Добавляем канал
-    success, msg = add_channel(channel_id, channel_name)
+    # Добавляем канал. Пометку dead ставит только /validate_channels: канал, добавленный
+    # до выдачи прав боту, не должен молча выпадать из рассылок
+    status = {}
+    if info['status'] == 'ok':
+        status = {'status': 'ok', 'error': None, 'checked_at': info['checked_at']}
+    success, msg = add_channel(channel_id, channel_name, **status)
     
     if success:
         await message.answer(
@@ -315,8 +434,8 @@ async def remove_channel_callback(callback: types.CallbackQuery):
     """Удаляет канал по callback"""
     channel_id = callback.data.replace("remove_channel_", "")
     
-    channels = load_channels()
-    channel_name = next((ch['name'] for ch in channels if ch['id'] == channel_id), channel_id)
+    channel = channel_registry.get(channel_id)
+    channel_name = channel['name'] if channel else channel_id
     
     success, msg = remove_channel(channel_id)
     
@@ -371,17 +490,51 @@ async def handle_other_messages(message: types.Message, state: FSMContext):
         )
 
 
-async def main():
-    """Запуск бота"""
-    logger.info("Бот запущен")
-    channels = load_channels()
+@dp.startup()
+async def on_startup(bot: Bot):
+    """Запуск бота: сессия к бэкенду и, в режиме webhook, регистрация адреса в Telegram"""
+    logger.info(f"Бот запущен (режим {BOT_MODE})")
+    channels = channel_registry.all()
     logger.info(f"Настроено каналов: {len(channels)}")
     if channels:
         logger.info(f"Каналы: {', '.join([ch['name'] for ch in channels])}")
+    await backend.start()
+    if BOT_MODE == 'webhook' and WEBHOOK_URL:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+
+@dp.shutdown()
+async def on_shutdown(bot: Bot):
+    """Остановка бота. Webhook не снимается: его могут обслуживать другие реплики"""
+    await backend.close()
+    if BOT_MODE == 'webhook':
+        await bot.session.close()
+    logger.info("Бот остановлен")
+
+
+def create_webhook_app():
+    """aiohttp приложение, принимающее обновления Telegram на WEBHOOK_PATH"""
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def main():
+    """Запуск бота в режиме long polling"""
+    # Пока установлен webhook, getUpdates недоступен
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
-
+    if BOT_MODE == 'webhook':
+        web.run_app(create_webhook_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    else:
+        import asyncio
+        asyncio.run(main())
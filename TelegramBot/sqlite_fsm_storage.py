@@ -0,0 +1,91 @@
+import json
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from Shared.sqlite_storage import transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM хранилище aiogram в SQLite с LRU кэшем в памяти.
+
+    Состояния переживают перезапуск и видны всем процессам бота, работающим
+    с той же базой. Чтение обычно обслуживается из кэша; перед ним
+    проверяется PRAGMA data_version, и если базу изменил другой процесс,
+    кэш сбрасывается целиком, так что реплики не видят устаревшее состояние.
+    """
+
+    def __init__(self, storage, cache_size=1024):
+        self._conn = storage.connect()
+        self._conn.executescript(SCHEMA)
+        self._cache = OrderedDict()  # ключ -> (состояние, данные)
+        self._cache_size = cache_size
+        self._version = None
+
+    @staticmethod
+    def _key(key):
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _load(self, key):
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return record
+        row = self._conn.execute('SELECT state, data FROM fsm_states WHERE key = ?', (key,)).fetchone()
+        record = (row[0], json.loads(row[1])) if row else (None, {})
+        self._remember(key, record)
+        return record
+
+    def _remember(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _save(self, key, column, value, record):
+        """Меняет одну колонку (state или data): вторую мог одновременно изменить другой процесс"""
+        with transaction(self._conn):
+            self._conn.execute(
+                f'INSERT INTO fsm_states (key, {column}, updated_at) VALUES (?, ?, ?) '
+                f'ON CONFLICT (key) DO UPDATE SET {column} = excluded.{column}, updated_at = excluded.updated_at',
+                (key, value, time.time())
+            )
+            # Пустые записи не храним, чтобы таблица не росла на каждого пользователя
+            self._conn.execute("DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data = '{}'", (key,))
+        self._remember(key, record)
+
+    async def set_state(self, key, state=None):
+        key = self._key(key)
+        state = state.state if isinstance(state, State) else state
+        _, data = self._load(key)
+        self._save(key, 'state', state, (state, data))
+
+    async def get_state(self, key):
+        return self._load(self._key(key))[0]
+
+    async def set_data(self, key, data):
+        key = self._key(key)
+        state, _ = self._load(key)
+        data = data.copy()
+        self._save(key, 'data', json.dumps(data, ensure_ascii=False), (state, data))
+
+    async def get_data(self, key):
+        return self._load(self._key(key))[1].copy()
+
+    async def close(self):
+        self._conn.close()